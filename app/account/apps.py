@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class AccountConfig(AppConfig):
-    name = 'account'
+    name = 'app.account'
+    label = 'account'
+
+    def ready(self):
+        from app.account import checks, signals  # noqa: F401
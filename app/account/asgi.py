@@ -0,0 +1,250 @@
+import asyncio
+import io
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import resolve, Resolver404
+from rest_framework import exceptions
+
+from app.account.authentication import ExtendJSONWebTokenAuthentication
+from app.account.pool import close_pools
+
+# 异步认证的读取接口（路由名称）
+ASYNC_READ_ROUTES = ('user-detail', 'user-id-list', 'some-user-detail', 'department-list', 'department-detail')
+
+
+class ExecutorSaturated(Exception):
+    """
+    线程池已满
+    """
+
+
+class BoundedExecutor(object):
+    """
+    执行ORM等阻塞调用的线程池，限制执行及排队数，超出时立即拒绝
+    """
+
+    def __init__(self, workers=8, queue_size=64, executor=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = executor
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        # 延迟创建，保证线程池在工作进程fork之后创建
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='asgi-sync')
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        在线程池中执行func，线程池已满时抛出ExecutorSaturated
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorSaturated()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._done(None)
+            raise
+        # 任务结束后才释放名额，请求取消（客户端断开）时任务仍然占用线程
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.workers, 0),
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+class _EnvironRequest(object):
+    # JWT认证只读取请求头及cookie
+    def __init__(self, environ):
+        self.META = environ
+        self.COOKIES = {}
+
+
+def build_environ(scope, body):
+    """
+    ASGI scope -> WSGI environ
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    # 请求体已完整读取，按实际长度设置
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class AccountASGIApplication(object):
+    """
+    ASGI入口
+    连接的等待、请求体读取及响应发送不占用线程；Django视图（ORM）在有限的线程池中执行，线程池已满时返回503
+    读取接口的JWT认证异步执行，认证缓存命中时不占用线程，认证失败直接返回401
+    """
+
+    def __init__(self, executor=None, wsgi_handler=None):
+        asgi_settings = getattr(settings, 'ASGI_EXECUTOR', {})
+        self.executor = executor or BoundedExecutor(
+            workers=asgi_settings.get('WORKERS', 8),
+            queue_size=asgi_settings.get('QUEUE_SIZE', 64),
+        )
+        self.retry_after = asgi_settings.get('RETRY_AFTER', 1)
+        self.wsgi_handler = wsgi_handler or WSGIHandler()
+        self.authentication = ExtendJSONWebTokenAuthentication()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('unsupported ASGI scope type: %s' % scope['type'])
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        environ = build_environ(scope, body)
+        try:
+            if scope['method'] in ('GET', 'HEAD') and self.is_async_read(environ['PATH_INFO']):
+                try:
+                    auth = await self.authentication.authenticate_async(_EnvironRequest(environ), self.executor.run)
+                except exceptions.AuthenticationFailed as exc:
+                    return await self.send_json(send, 401, {'detail': exc.detail},
+                                                [(b'www-authenticate', b'JWT realm="api"')])
+                if auth is not None:
+                    environ[ExtendJSONWebTokenAuthentication.pre_authenticated_key] = auth
+
+            loop = asyncio.get_running_loop()
+            start, content = await self.executor.run(self.call_wsgi, environ, send, loop)
+        except ExecutorSaturated:
+            return await self.send_json(send, 503, {'detail': '服务繁忙，请稍后重试'},
+                                        [(b'retry-after', str(self.retry_after).encode('ascii'))])
+        # 流式响应已在线程中发送
+        if start is not None:
+            await send(start)
+            await send({'type': 'http.response.body', 'body': content})
+
+    @staticmethod
+    def is_async_read(path):
+        try:
+            return resolve(path).url_name in ASYNC_READ_ROUTES
+        except Resolver404:
+            return False
+
+    @staticmethod
+    async def read_body(receive):
+        """
+        读取请求体，客户端断开时返回None
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    def call_wsgi(self, environ, send, loop):
+        """
+        在线程池中执行Django，返回 (响应开始消息, 响应体)
+        流式响应在当前线程中逐块发送，返回 (None, None)
+        """
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start['type'] = 'http.response.start'
+            start['status'] = int(status.split(' ', 1)[0])
+            start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        response = self.wsgi_handler(environ, start_response)
+        try:
+            if not getattr(response, 'streaming', False):
+                return start, b''.join(response)
+
+            def send_message(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            send_message(start)
+            for chunk in response:
+                send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_message({'type': 'http.response.body', 'body': b''})
+            return None, None
+        finally:
+            # 触发request_finished，在同一线程中关闭数据库连接
+            response.close()
+
+    @staticmethod
+    async def send_json(send, status, data, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii'))]
+            + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown()
+                close_pools()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
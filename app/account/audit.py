@@ -0,0 +1,280 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, router, transaction
+from django.utils import timezone
+
+from app.account.models import AuditLog, RealUser, Department
+
+logger = logging.getLogger(__name__)
+
+# 修改对象的类型
+TARGET_TYPES = {
+    RealUser: 'user',
+    Department: 'department',
+}
+# 只记录是否修改的字段
+MASKED_FIELDS = ('password', 'jwt_deadline')
+MASK = '******'
+# 不记录的字段
+IGNORED_FIELDS = ('update_time', 'last_login')
+
+
+def snapshot(instance, m2m_fields=()):
+    """
+    对象已加载的字段值，不查询数据库；多对多字段只在指定时查询
+    """
+    values = {}
+    for field in instance._meta.concrete_fields:
+        if field.name not in IGNORED_FIELDS:
+            values[field.attname] = field.value_from_object(instance)
+    for name in m2m_fields:
+        values[name] = sorted(getattr(instance, name).values_list('pk', flat=True))
+    return values
+
+
+def diff(before, after):
+    """
+    :return: {字段: [修改前, 修改后]}，创建时修改前为None，删除时修改后为None
+    """
+    before = before or {}
+    after = after or {}
+    changes = {}
+    for name in list(before) + [name for name in after if name not in before]:
+        old, new = before.get(name), after.get(name)
+        if old != new:
+            changes[name] = [MASK, MASK] if name in MASKED_FIELDS else [old, new]
+    return changes
+
+
+class _Flush(object):
+    """
+    队列中的刷新请求，写入之前的全部日志后通知
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+_STOP = object()
+
+
+class AuditLogWriter(object):
+    """
+    审计日志后台写入：请求中只记录修改内容并放入队列，后台线程按数量或时间批量写入
+    队列已满时请求等待block_timeout秒，仍然已满时在请求中直接写入，不丢弃日志
+    """
+
+    def __init__(self, enabled=True, queue_size=10000, batch_size=100, flush_interval=1.0, block_timeout=0.5,
+                 shutdown_timeout=5):
+        self.enabled = enabled
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.blocked = 0
+        self.sync_writes = 0
+        self.batches = 0
+        self._reset()
+
+    def _reset(self):
+        # fork后子进程使用新的队列及线程，父进程中未写入的日志由父进程写入
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = None
+        self._closed = False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, actor, action, instance, before=None, after=None):
+        """
+        记录一次修改，事务提交后放入队列，事务回滚时不记录
+        :param actor: 操作账户，未登录时为None或匿名账户
+        """
+        self.record_many(actor, action, type(instance), [instance.pk], before, after)
+
+    def record_many(self, actor, action, model, pks, before=None, after=None):
+        """
+        同一修改应用于多个对象（queryset.update等），每个对象一条日志，事务提交后放入队列
+        """
+        if not self.enabled or not pks:
+            return
+        changes = diff(before, after)
+        if action == 'update' and not changes:
+            return
+        actor_id = actor.pk if actor is not None and actor.is_authenticated else None
+        changes = json.dumps(changes, cls=DjangoJSONEncoder, ensure_ascii=False)
+        created_time = timezone.now()
+        entries = [AuditLog(actor_id=actor_id, action=action, target_type=TARGET_TYPES[model], target_id=pk,
+                            changes=changes, created_time=created_time) for pk in pks]
+
+        def enqueue():
+            for entry in entries:
+                self.enqueue(entry)
+
+        transaction.on_commit(enqueue, using=router.db_for_write(model))
+
+    def enqueue(self, entry):
+        self._ensure_started()
+        if self._closed:
+            # 进程退出过程中直接写入
+            self._write([entry])
+            return
+        try:
+            self._queue.put_nowait(entry)
+            return
+        except queue.Full:
+            with self._lock:
+                self.blocked += 1
+        try:
+            self._queue.put(entry, timeout=self.block_timeout)
+        except queue.Full:
+            with self._lock:
+                self.sync_writes += 1
+            self._write([entry])
+
+    def _collect(self):
+        """
+        等待第一条日志，之后收集至batch_size条或等待flush_interval秒
+        :return: (日志, 刷新请求, 是否停止)
+        """
+        batch, flushes = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is _STOP:
+                return batch, flushes, True
+            if isinstance(item, _Flush):
+                flushes.append(item)
+                return batch, flushes, False
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                return batch, flushes, False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, flushes, False
+
+    def _run(self):
+        while True:
+            batch, flushes, stop = self._collect()
+            if batch:
+                self._write(batch)
+            for flush in flushes:
+                flush.event.set()
+            if stop:
+                return
+
+    def _write(self, entries):
+        try:
+            AuditLog.objects.bulk_create(entries, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('failed to write %s audit log entries', len(entries))
+            with self._lock:
+                self.failed += len(entries)
+        else:
+            with self._lock:
+                self.written += len(entries)
+                self.batches += 1
+        finally:
+            # 与请求结束时一致，关闭超过CONN_MAX_AGE或已出错的连接
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+    def flush(self, timeout=None):
+        """
+        等待队列中已有的日志写入
+        :return: 是否在超时前完成
+        """
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or self._closed:
+                return True
+        flush = _Flush()
+        try:
+            self._queue.put(flush, timeout=timeout)
+        except queue.Full:
+            return False
+        return flush.event.wait(timeout)
+
+    def close(self):
+        """
+        进程退出时写入队列中剩余的日志
+        """
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        try:
+            self._queue.put(_STOP, timeout=self.shutdown_timeout)
+        except queue.Full:
+            pass
+        thread.join(self.shutdown_timeout)
+        if thread.is_alive():
+            logger.warning('audit log writer did not finish in %ss, %s entries pending',
+                           self.shutdown_timeout, self._queue.qsize())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+                'written': self.written,
+                'failed': self.failed,
+                'blocked': self.blocked,
+                'sync_writes': self.sync_writes,
+                'batches': self.batches,
+            }
+
+
+def query(actor_id=None, target_type=None, target_id=None, since=None, until=None):
+    """
+    按操作账户、修改对象及时间范围查询，按时间倒序（同一时间按id倒序）
+    操作账户及修改对象分别使用 (actor_id, created_time) 及 (target_type, target_id, created_time) 索引
+    只指定target_id时不能使用索引，需要同时指定target_type
+    """
+    if target_id is not None and target_type is None:
+        raise ValueError('target_id requires target_type')
+    queryset = AuditLog.objects.all()
+    if actor_id is not None:
+        queryset = queryset.filter(actor_id=actor_id)
+    if target_type is not None:
+        queryset = queryset.filter(target_type=target_type)
+    if target_id is not None:
+        queryset = queryset.filter(target_id=target_id)
+    if since is not None:
+        queryset = queryset.filter(created_time__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_time__lt=until)
+    return queryset.order_by('-created_time', '-id')
+
+
+_audit_log_settings = getattr(settings, 'AUDIT_LOG', {})
+
+# 审计日志写入，每个进程一个后台线程
+audit_log = AuditLogWriter(
+    enabled=_audit_log_settings.get('ENABLED', True),
+    queue_size=_audit_log_settings.get('QUEUE_SIZE', 10000),
+    batch_size=_audit_log_settings.get('BATCH_SIZE', 100),
+    flush_interval=_audit_log_settings.get('FLUSH_INTERVAL', 1.0),
+    block_timeout=_audit_log_settings.get('BLOCK_TIMEOUT', 0.5),
+    shutdown_timeout=_audit_log_settings.get('SHUTDOWN_TIMEOUT', 5),
+)
+atexit.register(audit_log.close)
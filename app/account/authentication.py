@@ -1,11 +1,19 @@
 import jwt
 
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
 from django.utils.translation import ugettext as _
 from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 from rest_framework_jwt.settings import api_settings
 
+from app.account import routers
+from app.account.cache import principal_cache
+from app.account.profiles import match_profile
+
 jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
+jwt_get_username_from_payload = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER
 
 
 class ExtendJSONWebTokenAuthentication(JSONWebTokenAuthentication):
@@ -13,17 +21,61 @@ class ExtendJSONWebTokenAuthentication(JSONWebTokenAuthentication):
     扩展jwt认证
     """
 
+    # ASGI入口预先认证的结果，WSGI环境变量中保存 (用户, token)
+    pre_authenticated_key = 'dark_gold.jwt_auth'
+
     def authenticate(self, request):
         """
         Returns a two-tuple of `User` and token if a valid signature has been
         supplied using JWT-based authentication.  Otherwise returns `None`.
         """
+        pre_authenticated = request.META.get(self.pre_authenticated_key)
+        if pre_authenticated is not None:
+            routers.pin_if_sticky(pre_authenticated[0].pk)
+            return pre_authenticated
+
+        jwt_value = self.get_jwt_value(request)
+        if jwt_value is None:
+            return None
+
+        payload = self.decode_payload(jwt_value)
+        # 账户刚修改过时，当前请求的其他读取同样使用主库
+        routers.pin_if_sticky(payload.get('user_id'))
+        user = self.authenticate_credentials(payload)
+        self.check_deadline(user, payload)
+        return (user, jwt_value)
+
+    async def authenticate_async(self, request, run_sync):
+        """
+        异步认证，token解码及认证缓存不阻塞，缓存未命中时查询数据库交由run_sync在线程池中执行
+        :param request: 包含META的请求
+        :param run_sync: 执行阻塞调用的协程函数 run_sync(func, *args)
+        """
         jwt_value = self.get_jwt_value(request)
         if jwt_value is None:
             return None
 
+        payload = self.decode_payload(jwt_value)
+        user = self.cached_credentials(payload)
+        if user is None:
+            user = await run_sync(self.lookup_credentials, payload)
+        self.check_deadline(user, payload)
+        return (user, jwt_value)
+
+    def lookup_credentials(self, payload):
+        """
+        在线程池中查询账户，线程不属于某个请求，查询后清除读写分离状态
+        """
+        try:
+            routers.pin_if_sticky(payload.get('user_id'))
+            return self.authenticate_credentials(payload)
+        finally:
+            routers.reset()
+
+    @staticmethod
+    def decode_payload(jwt_value):
         try:
-            payload = jwt_decode_handler(jwt_value)
+            return jwt_decode_handler(jwt_value)
         except jwt.ExpiredSignature:
             msg = _('Signature has expired.')
             raise exceptions.AuthenticationFailed(msg)
@@ -33,12 +85,87 @@ class ExtendJSONWebTokenAuthentication(JSONWebTokenAuthentication):
         except jwt.InvalidTokenError:
             raise exceptions.AuthenticationFailed()
 
-        user = self.authenticate_credentials(payload)
-
+    @staticmethod
+    def check_deadline(user, payload):
         # 扩展 验证该用户jwt过期时间
         # jwt签发时间早于过期时间，需要重新登录，返回状态码为401
         user_jwt_deadline = user.jwt_deadline
         if user_jwt_deadline and payload['iat'] < user_jwt_deadline:
             raise exceptions.AuthenticationFailed('jwt has expired.')
 
-        return (user, jwt_value)
+    @staticmethod
+    def cached_credentials(payload):
+        """
+        从认证缓存获取用户，未命中返回None，不查询数据库
+        """
+        user_id = payload.get('user_id')
+        if user_id is None or not principal_cache.enabled:
+            return None
+        user = principal_cache.get(user_id)
+        # 用户名与token不一致时视为未命中
+        if user is None or user.get_username() != jwt_get_username_from_payload(payload):
+            return None
+        if not user.is_active:
+            msg = _('User account is disabled.')
+            raise exceptions.AuthenticationFailed(msg)
+        return user
+
+    @staticmethod
+    def load_user(payload):
+        """
+        与JSONWebTokenAuthentication一致，账户始终从主库读取
+        只读副本可能延迟，读取到旧的jwt_deadline、is_active时已失效的token仍能通过认证
+        """
+        username = jwt_get_username_from_payload(payload)
+        if not username:
+            msg = _('Invalid payload.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        user_model = get_user_model()
+        try:
+            user = user_model._default_manager.db_manager(DEFAULT_DB_ALIAS).get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if not user.is_active:
+            msg = _('User account is disabled.')
+            raise exceptions.AuthenticationFailed(msg)
+        return user
+
+    def authenticate_credentials(self, payload):
+        """
+        优先从认证缓存获取用户，未命中时从主库查询并写入缓存
+        """
+        user = self.cached_credentials(payload)
+        if user is None:
+            cacheable = payload.get('user_id') is not None and principal_cache.enabled
+            # 查询前读取版本号，查询期间账户被修改时缓存的结果随即失效
+            generation = principal_cache.generation(payload['user_id']) if cacheable else None
+            user = self.load_user(payload)
+            if cacheable:
+                principal_cache.set(user.pk, user, generation)
+        return user
+
+
+class RequestProfileAuthentication(BaseAuthentication):
+    """
+    按URL前缀（settings.REQUEST_PROFILES）依次使用不同的认证类，没有匹配时不认证
+    例如 /api/ 只使用JWT认证，不查询会话、不校验Basic密码
+    """
+
+    def get_authenticators(self, request):
+        profile = match_profile(request._request.path_info)
+        return profile.get_authenticators() if profile is not None else []
+
+    def authenticate(self, request):
+        for authenticator in self.get_authenticators(request):
+            user_auth_tuple = authenticator.authenticate(request)
+            if user_auth_tuple is not None:
+                return user_auth_tuple
+        return None
+
+    def authenticate_header(self, request):
+        # 与DRF一致，使用第一个认证类的WWW-Authenticate，未认证时返回401
+        authenticators = self.get_authenticators(request)
+        return authenticators[0].authenticate_header(request) if authenticators else None
@@ -0,0 +1,12 @@
+from django.db.backends.mysql import base
+
+from app.account.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    使用连接池的MySQL
+    """
+
+    def check_pooled_connection(self, connection):
+        connection.ping()
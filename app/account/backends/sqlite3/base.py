@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+from app.account.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    使用连接池的SQLite，用于本地测试连接池
+    """
+
+    def pool_enabled(self):
+        # 内存数据库关闭连接即删除数据，不使用连接池
+        return not self.is_in_memory_db() and super().pool_enabled()
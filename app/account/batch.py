@@ -0,0 +1,161 @@
+import io
+import json
+from collections.abc import Mapping
+from urllib.parse import urlsplit, unquote
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import resolve, Resolver404
+from rest_framework import serializers, status
+
+from app.account import routers
+from app.account.authentication import ExtendJSONWebTokenAuthentication
+from app.account.cache import response_cache
+
+_batch_settings = getattr(settings, 'BATCH_REQUESTS', {})
+# 最多子请求数
+MAX_ITEMS = _batch_settings.get('MAX_ITEMS', 50)
+# 请求体最大字节数
+MAX_BODY_SIZE = _batch_settings.get('MAX_BODY_SIZE', 1024 * 1024)
+
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# 属于批量请求本身的请求头，不传递给子请求
+EXCLUDED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH', 'HTTP_IF_MODIFIED_SINCE',
+                 'HTTP_IF_UNMODIFIED_SINCE')
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=BATCH_METHODS)
+    path = serializers.CharField(max_length=2048)
+    body = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_path(self, value):
+        parts = urlsplit(value)
+        if parts.scheme or parts.netloc or not parts.path.startswith('/api/'):
+            raise serializers.ValidationError('只支持/api/下的路径')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    批量请求，transactional为true时全部子请求在同一事务中执行，任一失败全部回滚
+    """
+    transactional = serializers.BooleanField(default=False)
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+
+    def to_internal_value(self, data):
+        # 校验每个子请求之前限制数量
+        items = data.get('requests') if isinstance(data, Mapping) else None
+        if isinstance(items, list) and len(items) > MAX_ITEMS:
+            raise serializers.ValidationError({'requests': ['最多%s个请求' % MAX_ITEMS]})
+        return super().to_internal_value(data)
+
+
+def read_body(request, limit):
+    """
+    按实际读取的字节数限制请求体，不依赖Content-Length（分块传输时没有该请求头）
+    最多读取limit+1字节，超出时返回False；读取的内容保存在请求中，之后按原方式解析
+    """
+    http_request = request._request
+    if http_request._read_started:
+        return len(http_request.body) <= limit
+    body = http_request.read(limit + 1)
+    if len(body) > limit:
+        return False
+    # 与HttpRequest.body一致
+    http_request._body = body
+    http_request._stream = io.BytesIO(body)
+    http_request.META['CONTENT_LENGTH'] = str(len(body))
+    return True
+
+
+def build_request(request, method, path, body):
+    """
+    构造子请求，复制批量请求的请求头，使用批量请求的认证结果
+    """
+    parts = urlsplit(path)
+    content = b'' if body is None else json.dumps(body).encode('utf-8')
+    environ = {key: value for key, value in request.META.items() if key not in EXCLUDED_META}
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': unquote(parts.path).encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': parts.query,
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': io.BytesIO(content),
+        ExtendJSONWebTokenAuthentication.pre_authenticated_key: (request.user, request.auth),
+    })
+    if content:
+        environ['CONTENT_TYPE'] = 'application/json'
+    return WSGIRequest(environ)
+
+
+def _result(status_code, body):
+    return {'status': status_code, 'body': body}
+
+
+def execute(request, method, path, body=None):
+    """
+    在当前进程中执行子请求，不经过中间件
+    :return: {'status': 状态码, 'body': 响应数据}
+    """
+    sub_request = build_request(request, method, path, body)
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return _result(status.HTTP_404_NOT_FOUND, {'detail': '未找到。'})
+    if match.url_name == 'batch':
+        return _result(status.HTTP_400_BAD_REQUEST, {'detail': '不支持嵌套批量请求'})
+    # 按视图类拒绝流式响应的接口，不执行导出查询
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    if getattr(view_class, 'streaming', False):
+        return _result(status.HTTP_400_BAD_REQUEST, {'detail': '不支持流式响应的接口'})
+
+    sub_request.resolver_match = match
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Exception as exc:
+        response = response_for_exception(sub_request, exc)
+
+    if response.streaming:
+        return _result(status.HTTP_400_BAD_REQUEST, {'detail': '不支持流式响应的接口'})
+    # DRF响应直接使用数据，不渲染后再解析
+    if hasattr(response, 'data'):
+        return _result(response.status_code, response.data)
+    content = response.content
+    if content and response.get('Content-Type', '').startswith('application/json'):
+        return _result(response.status_code, json.loads(content.decode(response.charset)))
+    return _result(response.status_code, content.decode(response.charset) or None)
+
+
+def execute_batch(request, requests, transactional=False):
+    """
+    依次执行子请求
+    事务模式下全部读写使用主库，第一个失败（状态码>=400）的请求之后不再执行，全部回滚
+    事务模式下子请求不读取、不写入响应缓存，回滚后缓存中不会留下未提交的数据
+    :return: {'rolled_back': 是否已回滚, 'results': [{'status': 状态码, 'body': 响应数据}]}
+    """
+    if not transactional:
+        results = []
+        for item in requests:
+            # 按子请求的方法选择主库或副本，已写入时仍使用主库
+            routers.route_request(item['method'])
+            results.append(execute(request, item['method'], item['path'], item.get('body')))
+        return {'rolled_back': False, 'results': results}
+
+    routers.pin_primary()
+    results = []
+    rolled_back = False
+    with transaction.atomic(), response_cache.bypass():
+        for item in requests:
+            result = execute(request, item['method'], item['path'], item.get('body'))
+            results.append(result)
+            if result['status'] >= 400:
+                rolled_back = True
+                transaction.set_rollback(True)
+                break
+    skipped = len(requests) - len(results)
+    results += [_result(status.HTTP_424_FAILED_DEPENDENCY, {'detail': '之前的请求失败，未执行'})
+                for _ in range(skipped)]
+    return {'rolled_back': rolled_back, 'results': results}
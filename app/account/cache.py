@@ -0,0 +1,384 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+
+# 只在当前进程内保存数据的缓存后端，多进程部署时数据修改后其他进程的缓存不会失效
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared_cache(alias):
+    """
+    缓存是否在多个进程间共享（memcached、redis、数据库等）
+    """
+    return not isinstance(caches[alias], LOCAL_CACHE_BACKENDS)
+
+
+def bump_generations(cache, keys):
+    """
+    增加版本号
+    """
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # 版本号不存在或已过期，重新写入时不能与旧版本相同
+            cache.set(key, int(time.time() * 1000), None)
+
+
+class PrincipalCache(object):
+    """
+    认证用户缓存，按用户id缓存，限制最大数量及有效期（LRU淘汰）
+    进程内只保存账户字段值，每次命中时构造新的账户对象，不同请求（线程）不共享同一个request.user
+    共享缓存（alias）中保存每个账户的版本号，命中时版本号不一致视为失效，账户修改后所有进程同时失效
+    """
+    prefix = 'account:principal'
+
+    def __init__(self, max_size=10000, timeout=60, alias='default', enabled=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.alias = alias
+        self._enabled = enabled
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        """
+        未指定时只在使用共享缓存时开启，进程内缓存的版本号不能通知其他进程
+        """
+        enabled = is_shared_cache(self.alias) if self._enabled is None else self._enabled
+        return enabled and self.max_size > 0 and self.timeout > 0
+
+    def _generation_key(self, pk):
+        return '%s:gen:%s' % (self.prefix, pk)
+
+    def generation(self, pk):
+        """
+        账户当前的版本号，查询数据库前读取，与查询结果一起写入缓存
+        """
+        return self.cache.get(self._generation_key(pk), 0)
+
+    def get(self, pk):
+        """
+        获取缓存用户，不存在、已过期或版本号已变化返回None
+        """
+        with self._lock:
+            item = self._data.get(pk)
+            if item is not None and item[2] <= time.monotonic():
+                del self._data[pk]
+                item = None
+        # 版本号在锁外读取，共享缓存需要网络请求
+        if item is not None and item[1] != self.generation(pk):
+            with self._lock:
+                if self._data.get(pk) is item:
+                    del self._data[pk]
+            item = None
+        with self._lock:
+            if item is None:
+                self.misses += 1
+                return None
+            if pk in self._data:
+                self._data.move_to_end(pk)
+            self.hits += 1
+        model, db, names, values = item[0]
+        return model.from_db(db, names, values)
+
+    def set(self, pk, user, generation):
+        """
+        :param generation: 查询数据库前读取的版本号，查询期间账户被修改时下次命中即失效
+        """
+        if not self.enabled:
+            return
+        names = [field.attname for field in user._meta.concrete_fields]
+        state = (type(user), user._state.db, names, [getattr(user, name) for name in names])
+        with self._lock:
+            self._data[pk] = (state, generation, time.monotonic() + self.timeout)
+            self._data.move_to_end(pk)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, pk):
+        """
+        增加版本号，立即执行并在事务提交后再执行一次，避免提交前读取的旧数据以新版本号写入缓存
+        """
+        with self._lock:
+            self._data.pop(pk, None)
+        if not self.enabled:
+            return
+        keys = [self._generation_key(pk)]
+        bump_generations(self.cache, keys)
+        transaction.on_commit(lambda: bump_generations(self.cache, keys))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        缓存命中统计
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'timeout': self.timeout,
+            }
+
+
+_principal_cache_settings = getattr(settings, 'PRINCIPAL_CACHE', {})
+
+# 认证用户缓存，进程内共享，版本号保存在共享缓存中
+principal_cache = PrincipalCache(
+    max_size=_principal_cache_settings.get('MAX_SIZE', 10000),
+    timeout=_principal_cache_settings.get('TIMEOUT', 60),
+    alias=_principal_cache_settings.get('ALIAS', 'default'),
+    enabled=_principal_cache_settings.get('ENABLED'),
+)
+
+
+class _Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class SingleFlight(object):
+    """
+    同一进程内相同key的并发请求只有一个执行，其他请求等待其结果
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def acquire(self, key):
+        """
+        :return: (是否由当前请求执行, flight)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                return True, flight
+            return False, flight
+
+    def release(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.event.set()
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class ResponseCache(object):
+    """
+    接口响应缓存
+    缓存key包含版本号，数据变化时增加版本号使旧缓存失效，不需要遍历删除
+    """
+    prefix = 'account:response'
+
+    def __init__(self, alias='default', timeout=300, enabled=None, wait_timeout=10):
+        self.alias = alias
+        self.timeout = timeout
+        self._enabled = enabled
+        self.wait_timeout = wait_timeout
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        """
+        未指定时只在使用共享缓存时开启，否则其他进程中的数据修改不能使当前进程的缓存失效
+        """
+        return is_shared_cache(self.alias) if self._enabled is None else self._enabled
+
+    @property
+    def bypassed(self):
+        return getattr(self._local, 'bypass', False)
+
+    @contextmanager
+    def bypass(self):
+        """
+        当前线程内不读取、不写入缓存，用于可能回滚的事务，避免未提交的数据写入缓存
+        """
+        previous = self.bypassed
+        self._local.bypass = True
+        try:
+            yield
+        finally:
+            self._local.bypass = previous
+
+    def _generation_key(self, name):
+        return '%s:gen:%s' % (self.prefix, name)
+
+    def make_key(self, scope, role, path, generations):
+        values = self.cache.get_many([self._generation_key(name) for name in generations])
+        versions = ','.join(str(values.get(self._generation_key(name), 0)) for name in generations)
+        digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+        return '%s:%s:%s:%s:%s' % (self.prefix, scope, role, versions, digest)
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, self.timeout)
+
+    def wait(self, key, flight):
+        """
+        等待相同请求执行完成后读取缓存，超时或该请求未写入缓存时返回None
+        """
+        if not flight.event.wait(self.wait_timeout):
+            return None
+        entry = self.cache.get(key)
+        if entry is not None:
+            with self._lock:
+                self.coalesced += 1
+        return entry
+
+    def invalidate(self, *generations):
+        """
+        增加版本号，立即执行并在事务提交后再执行一次，避免提交前读取的旧数据写入新版本缓存
+        """
+        self._bump(generations)
+        transaction.on_commit(lambda: self._bump(generations))
+
+    def _bump(self, generations):
+        bump_generations(self.cache, [self._generation_key(name) for name in generations])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'in_flight': len(self.flights),
+            }
+
+
+_response_cache_settings = getattr(settings, 'RESPONSE_CACHE', {})
+
+# 接口响应缓存
+response_cache = ResponseCache(
+    alias=_response_cache_settings.get('ALIAS', 'default'),
+    timeout=_response_cache_settings.get('TIMEOUT', 300),
+    enabled=_response_cache_settings.get('ENABLED'),
+    wait_timeout=_response_cache_settings.get('WAIT_TIMEOUT', 10),
+)
+
+
+def user_generation(pk):
+    """
+    单个账户的缓存版本号名称
+    """
+    return 'user:%s' % pk
+
+
+class _CachedResponse(Exception):
+    """
+    命中缓存，直接返回缓存的响应
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ResponseCacheMixin(object):
+    """
+    GET读取接口响应缓存，按请求路径（含查询参数）、用户角色及依赖数据的版本号缓存返回数据
+    认证及权限校验之后读取缓存；同一进程内相同请求同时未命中时只有一个请求查询数据库
+    与ConditionalGetMixin同时使用时放在其前面，命中缓存时ETag同样从缓存读取
+    """
+    cache_actions = ('list', 'retrieve')
+
+    def get_cache_generations(self, request, *args, **kwargs):
+        """
+        返回数据依赖的版本号名称，返回None为不缓存
+        """
+        return []
+
+    def initial(self, request, *args, **kwargs):
+        self._cache_key = None
+        self._cache_flight = None
+        super().initial(request, *args, **kwargs)
+        if not response_cache.enabled or response_cache.bypassed or request.method != 'GET' or \
+                getattr(self, 'action', None) not in self.cache_actions:
+            return
+        generations = self.get_cache_generations(request, *args, **kwargs)
+        if generations is None:
+            return
+
+        role = 'admin' if request.user and request.user.is_superuser else 'user'
+        key = response_cache.make_key(type(self).__name__, role, request.get_full_path(), generations)
+        entry = response_cache.get(key)
+        if entry is None:
+            leader, flight = response_cache.flights.acquire(key)
+            if leader:
+                self._cache_key, self._cache_flight = key, flight
+                return
+            entry = response_cache.wait(key, flight)
+            if entry is None:
+                return
+
+        self._conditional = entry['conditional']
+        response = Response(entry['data'])
+        response['X-Cache'] = 'HIT'
+        raise _CachedResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _CachedResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_cache_key', None) is not None and response.status_code == 200:
+            response_cache.set(self._cache_key, {
+                'data': response.data,
+                'conditional': getattr(self, '_conditional', None),
+            })
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # 异常时同样释放，等待的请求自行查询
+            if getattr(self, '_cache_flight', None) is not None:
+                response_cache.flights.release(self._cache_key, self._cache_flight)
@@ -0,0 +1,72 @@
+from django.core import checks
+from django.db import DatabaseError
+from django.utils.module_loading import import_string
+
+from app.account import routers, tree
+from app.account.cache import is_shared_cache
+from app.account.profiles import match_profile
+
+# admin需要的中间件（代替admin.E408~E410）
+ADMIN_MIDDLEWARE = [
+    ('django.contrib.auth.middleware.AuthenticationMiddleware', 'account.E001'),
+    ('django.contrib.messages.middleware.MessageMiddleware', 'account.E002'),
+    ('django.contrib.sessions.middleware.SessionMiddleware', 'account.E003'),
+]
+
+
+def _contains_subclass(class_path, candidate_paths):
+    cls = import_string(class_path)
+    for path in candidate_paths:
+        try:
+            candidate_cls = import_string(path)
+        except ImportError:
+            continue
+        if isinstance(candidate_cls, type) and issubclass(candidate_cls, cls):
+            return True
+    return False
+
+
+@checks.register(checks.Tags.admin)
+def check_admin_profile(app_configs, **kwargs):
+    """
+    admin路径匹配的 REQUEST_PROFILES 需要包含会话、认证及消息中间件
+    """
+    profile = match_profile('/admin/')
+    if profile is None:
+        return [checks.Error("REQUEST_PROFILES must match '/admin/' in order to use the admin application.",
+                             id='account.E004')]
+    return [
+        checks.Error("'%s' must be in the REQUEST_PROFILES middleware matching '/admin/' in order to use the "
+                     "admin application." % path, id=error_id)
+        for path, error_id in ADMIN_MIDDLEWARE if not _contains_subclass(path, profile.middleware)
+    ]
+
+
+@checks.register()
+def check_replica_sticky_cache(app_configs, **kwargs):
+    """
+    配置只读副本时，写入记录需要保存在共享缓存中，否则其他工作进程写入后仍读取副本中的旧数据
+    """
+    alias = routers.sticky_cache_alias()
+    if not routers.replica_aliases() or is_shared_cache(alias):
+        return []
+    return [checks.Error("DATABASE_REPLICAS['CACHE_ALIAS'] ('%s') must be a cache shared by all worker processes "
+                         "when DATABASE_REPLICAS['ALIASES'] is set." % alias,
+                         hint='Use memcached or another shared backend for this cache alias.', id='account.E005')]
+
+
+@checks.register(checks.Tags.database)
+def check_department_tree(app_configs, **kwargs):
+    """
+    已存在的部门需要执行 rebuild_department_tree 写入闭包表，否则下级成员、人数等接口结果为空
+    只在 migrate 及 check --tag database 时执行
+    """
+    try:
+        missing = tree.missing_nodes().count()
+    except DatabaseError:
+        # 尚未执行migrate
+        return []
+    if not missing:
+        return []
+    return [checks.Warning('%s department(s) have no rows in the department closure table.' % missing,
+                           hint="Run 'python manage.py rebuild_department_tree'.", id='account.W001')]
@@ -0,0 +1,182 @@
+import threading
+from collections import OrderedDict
+
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+# detail_url 中id的占位符
+_PK_PLACEHOLDER = '999999999999'
+# 最多缓存的序列化计划数，字段组合过多时不再缓存
+MAX_PLANS = 1024
+
+
+class FieldPlan(object):
+    """
+    只读序列化计划
+    由序列化器字段预先生成，按 .values() 结果直接生成返回数据，不创建模型实例
+    """
+
+    def __init__(self, names, columns, converters, many_fields, url_fields):
+        # 输出字段名，顺序与序列化器一致
+        self.names = names
+        # .values() 查询的列
+        self.columns = columns
+        # 每个输出字段的 (类型, 列名或字段, 转换函数)
+        self.converters = converters
+        # 多对多字段 {字段名: 模型字段}
+        self.many_fields = many_fields
+        # 超链接字段 {字段名: (view_name, lookup_field, lookup_url_kwarg)}
+        self.url_fields = url_fields
+
+    def _load_many(self, pks):
+        # 每个多对多字段一次查询，排序与关联模型默认排序一致
+        values = {}
+        for name, model_field in self.many_fields.items():
+            through = model_field.remote_field.through
+            source_name = model_field.m2m_field_name()
+            target_name = model_field.m2m_reverse_field_name()
+            ordering = [
+                ('-' if o.startswith('-') else '') + target_name + '__' + o.lstrip('-')
+                for o in model_field.related_model._meta.ordering
+            ] or ['pk']
+            related = {}
+            for source_id, target_id in through.objects.filter(**{source_name + '__in': pks}) \
+                    .order_by(*ordering).values_list(source_name, target_name):
+                related.setdefault(source_id, []).append(target_id)
+            values[name] = related
+        return values
+
+    def _url_templates(self, request):
+        templates = {}
+        for name, (view_name, lookup_field, lookup_url_kwarg) in self.url_fields.items():
+            url = reverse(view_name, kwargs={lookup_url_kwarg: _PK_PLACEHOLDER})
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            prefix, suffix = url.split(_PK_PLACEHOLDER)
+            templates[name] = (lookup_field, prefix, suffix)
+        return templates
+
+    def render(self, rows, request=None):
+        """
+        .values() 结果 -> 与序列化器一致的返回数据
+        """
+        rows = list(rows)
+        many = self._load_many([row['pk'] for row in rows]) if self.many_fields else {}
+        templates = self._url_templates(request) if self.url_fields else {}
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, kind, column, convert in self.converters:
+                if kind == 'value':
+                    value = row[column]
+                    item[name] = value if value is None or convert is None else convert(value)
+                elif kind == 'many':
+                    item[name] = many[name].get(row['pk'], [])
+                else:
+                    lookup_field, prefix, suffix = templates[name]
+                    item[name] = prefix + str(row[lookup_field]) + suffix
+            data.append(item)
+        return data
+
+
+def _compile(serializer_class, fields=None):
+    serializer = serializer_class(fields=fields)
+    model = serializer.Meta.model
+    columns = ['pk']
+    converters = []
+    many_fields = OrderedDict()
+    url_fields = OrderedDict()
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            lookup_field = field.lookup_field
+            if lookup_field not in columns:
+                columns.append(lookup_field)
+            url_fields[name] = (field.view_name, lookup_field, field.lookup_url_kwarg)
+            converters.append((name, 'url', None, None))
+        elif isinstance(field, serializers.ManyRelatedField):
+            if not isinstance(field.child_relation, serializers.PrimaryKeyRelatedField) or \
+                    field.child_relation.pk_field is not None or '.' in field.source:
+                return None
+            many_fields[name] = model._meta.get_field(field.source)
+            converters.append((name, 'many', None, None))
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            if field.pk_field is not None or '.' in field.source:
+                return None
+            # .values() 外键列直接返回id
+            columns.append(field.source)
+            converters.append((name, 'value', field.source, None))
+        elif isinstance(field, (serializers.BaseSerializer, serializers.RelatedField,
+                                serializers.SerializerMethodField, serializers.ReadOnlyField)) \
+                or '.' in field.source or field.source == '*':
+            # 嵌套序列化器、方法字段等不支持，使用通用序列化
+            return None
+        else:
+            columns.append(field.source)
+            converters.append((name, 'value', field.source, field.to_representation))
+
+    return FieldPlan([c[0] for c in converters], columns, converters, many_fields, url_fields)
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_plan(serializer_class, role=None, fields=None):
+    """
+    获取序列化计划，每个序列化器类、角色及字段组合只生成一次
+    序列化器包含不支持的字段时返回None
+    :param fields: 只返回的字段，None为全部字段
+    """
+    key = (serializer_class, role, fields)
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+    with _plans_lock:
+        if key not in _plans:
+            if len(_plans) >= MAX_PLANS:
+                return _compile(serializer_class, fields)
+            _plans[key] = _compile(serializer_class, fields)
+        return _plans[key]
+
+
+class CompiledListMixin(object):
+    """
+    列表接口只读快速序列化，按 .values() 查询生成返回数据，结果与序列化器一致
+    """
+
+    def get_plan_role(self):
+        user = self.request.user
+        return 'admin' if user and user.is_superuser else 'user'
+
+    def get_sparse_fields(self):
+        return None
+
+    def get_pagination_columns(self, queryset):
+        """
+        游标分页按排序字段生成游标，排序字段需要在 .values() 的列中，不在返回数据中
+        """
+        paginator = self.paginator
+        if not isinstance(paginator, CursorPagination):
+            return []
+        return [field.lstrip('-') for field in paginator.get_ordering(self.request, queryset, self)]
+
+    def list(self, request, *args, **kwargs):
+        plan = get_plan(self.get_serializer_class(), self.get_plan_role(), self.get_sparse_fields())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = plan.columns + [column for column in self.get_pagination_columns(queryset)
+                                  if column not in plan.columns]
+        queryset = queryset.values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page, request))
+        return Response(plan.render(queryset, request))
@@ -0,0 +1,126 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class _NotModified(Exception):
+    """
+    版本未变化，直接返回304
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+
+def to_timestamp(value):
+    """
+    数据库时间 -> unix时间戳，None返回None
+    """
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return int(value.timestamp())
+
+
+def collection_version(queryset, field='update_time'):
+    """
+    集合版本：数量及最大更新时间，新增、删除、修改任意一行都会变化
+    """
+    result = queryset.order_by().aggregate(count=Count('pk'), last=Max(field))
+    return (result['count'], result['last']), result['last']
+
+
+class ConditionalGetMixin(object):
+    """
+    GET请求返回ETag/Last-Modified
+    请求头 If-None-Match / If-Modified-Since 与当前版本一致时返回304，不执行查询主体及序列化
+    版本只查询更新时间，认证及权限校验之后计算；无条件请求头时详情接口直接使用已查询的对象计算
+    """
+    conditional_actions = ('list', 'retrieve')
+    version_field = 'update_time'
+
+    def get_version_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def get_version(self, request, *args, **kwargs):
+        """
+        :return: (版本, 最后修改时间)，None为不使用条件请求
+        """
+        instance = getattr(self, '_version_instance', None)
+        if instance is not None:
+            row = (instance.pk, getattr(instance, self.version_field))
+            return row, row[1]
+
+        queryset = self.get_version_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in kwargs:
+            try:
+                row = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}) \
+                    .values_list('pk', self.version_field).first()
+            except (TypeError, ValueError):
+                return None
+            if row is None:
+                return None
+            return row, row[1]
+        return collection_version(queryset, self.version_field)
+
+    def get_etag(self, request, version):
+        # 管理员与普通用户返回字段不同，查询参数影响分页及返回内容
+        role = 'admin' if request.user and request.user.is_superuser else 'user'
+        key = '|'.join([role, request.get_full_path(), repr(version)])
+        return 'W/"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def _compute_conditional(self, request, *args, **kwargs):
+        version = self.get_version(request, *args, **kwargs)
+        if version is None:
+            return None
+        return self.get_etag(request, version[0]), to_timestamp(version[1])
+
+    def get_object(self):
+        instance = super().get_object()
+        self._version_instance = instance
+        return instance
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._conditional = None
+        self._version_instance = None
+        # 非视图集按是否包含主键区分列表与详情
+        action = getattr(self, 'action', None) or \
+            ('retrieve' if (self.lookup_url_kwarg or self.lookup_field) in kwargs else 'list')
+        self._conditional_enabled = request.method in ('GET', 'HEAD') and action in self.conditional_actions
+        if not self._conditional_enabled:
+            return
+        if 'HTTP_IF_NONE_MATCH' not in request.META and 'HTTP_IF_MODIFIED_SINCE' not in request.META:
+            return
+
+        self._conditional = self._compute_conditional(request, *args, **kwargs)
+        if self._conditional is None:
+            return
+        etag, last_modified = self._conditional
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            raise _NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if not getattr(self, '_conditional_enabled', False) or response.status_code not in (200, 304):
+            return response
+        conditional = self._conditional
+        if conditional is None and response.status_code == 200:
+            conditional = self._conditional = self._compute_conditional(request, *args, **kwargs)
+        if conditional is not None:
+            etag, last_modified = conditional
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,178 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+
+from app.account.compiled import get_plan
+from app.account.conditional import collection_version
+from app.account.models import RealUser, Department
+from app.account.serializers import RealUserDetailSerializer, RealUserLimitedDetailSerializer, DepartmentSerializer
+
+# 可展开的外键字段
+EXPANDABLE = {
+    RealUser: ('department',),
+    Department: ('director',),
+}
+# 展开对象的序列化器 (管理员, 普通用户)，与详情接口一致
+EXPAND_SERIALIZERS = {
+    RealUser: (RealUserDetailSerializer, RealUserLimitedDetailSerializer),
+    Department: (DepartmentSerializer, DepartmentSerializer),
+}
+# 展开对象对应的响应缓存版本号名称
+EXPAND_GENERATIONS = {
+    RealUser: 'users',
+    Department: 'department',
+}
+# 最多展开层数，如 department.director
+MAX_DEPTH = 2
+
+
+def parse_expand(value, model):
+    """
+    expand=department,department.director -> {'department': {'director': {}}}
+    不支持的字段抛出ValidationError
+    """
+    tree = OrderedDict()
+    unknown = []
+    for path in (value or '').split(','):
+        path = path.strip()
+        if not path:
+            continue
+        names = path.split('.')
+        node, current = tree, model
+        for name in names:
+            if len(names) > MAX_DEPTH or name not in EXPANDABLE.get(current, ()):
+                unknown.append(path)
+                break
+            node = node.setdefault(name, OrderedDict())
+            current = current._meta.get_field(name).related_model
+    if unknown:
+        raise ValidationError({'expand': ['不支持的展开: %s' % ','.join(unknown)]})
+    return tree
+
+
+def expanded_models(tree, model):
+    """
+    展开涉及的全部模型
+    """
+    models = []
+    for name, subtree in tree.items():
+        related_model = model._meta.get_field(name).related_model
+        for item in [related_model] + expanded_models(subtree, related_model):
+            if item not in models:
+                models.append(item)
+    return models
+
+
+def expanded_querysets(tree, queryset):
+    """
+    展开对象的查询，按上一层数据中的外键逐层筛选，只包含实际展开的行
+    """
+    querysets = []
+    for name, subtree in tree.items():
+        field = queryset.model._meta.get_field(name)
+        related = field.related_model.objects.filter(pk__in=queryset.order_by().values(field.attname))
+        querysets.append(related)
+        querysets += expanded_querysets(subtree, related)
+    return querysets
+
+
+def _load(model, pks, tree, role, request):
+    """
+    一次查询加载全部关联对象并按角色序列化
+    :return: {主键: 返回数据}
+    """
+    if not pks:
+        return {}
+    admin_class, user_class = EXPAND_SERIALIZERS[model]
+    serializer_class = admin_class if role == 'admin' else user_class
+    queryset = model.objects.filter(pk__in=pks)
+    plan = get_plan(serializer_class, role)
+    if plan is not None:
+        rows = list(queryset.values(*plan.columns))
+        keys = [row['pk'] for row in rows]
+        data = plan.render(rows, request)
+    else:
+        instances = list(queryset)
+        keys = [instance.pk for instance in instances]
+        data = serializer_class(instances, many=True, context={'request': request}).data
+    expand_items(data, model, tree, role, request)
+    return dict(zip(keys, data))
+
+
+def expand_items(items, model, tree, role, request):
+    """
+    将返回数据中的外键id替换为关联对象，每个关联字段一次查询，未返回该字段时不处理
+    """
+    for name, subtree in tree.items():
+        related_model = model._meta.get_field(name).related_model
+        pks = {item[name] for item in items if item.get(name) is not None}
+        related = _load(related_model, pks, subtree, role, request)
+        for item in items:
+            if name in item and item[name] is not None:
+                item[name] = related.get(item[name])
+    return items
+
+
+class ExpandMixin(object):
+    """
+    GET请求参数 expand=department,department.director 将外键id展开为关联对象
+    整页数据的每个关联字段一次查询；展开对象按当前角色的详情序列化器返回字段
+    放在ResponseCacheMixin前面：缓存只保存未展开的数据，展开对象每次查询
+    """
+    # 返回数据的模型，默认为queryset的模型
+    expand_model = None
+
+    def get_expand_model(self):
+        return self.expand_model or self.get_queryset().model
+
+    def get_expand(self):
+        if not hasattr(self, '_expand'):
+            self._expand = OrderedDict()
+            if self.request.method in ('GET', 'HEAD'):
+                self._expand = parse_expand(self.request.query_params.get('expand'), self.get_expand_model())
+        return self._expand
+
+    def get_expand_generations(self):
+        """
+        展开对象的缓存版本号名称，展开对象变化时缓存的ETag同样失效
+        """
+        return [EXPAND_GENERATIONS[model] for model in expanded_models(self.get_expand(), self.get_expand_model())]
+
+    def get_version(self, request, *args, **kwargs):
+        version = super().get_version(request, *args, **kwargs)
+        tree = self.get_expand()
+        if version is None or not tree:
+            return version
+        # 展开对象变化时版本同样变化，只计算返回数据引用的行，不统计整个表
+        queryset = self.get_version_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in kwargs:
+            queryset = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        versions = [version[0]]
+        last_modified = [version[1]]
+        for related in expanded_querysets(tree, queryset):
+            model_version, model_last_modified = collection_version(related)
+            versions.append(model_version)
+            last_modified.append(model_last_modified)
+        return tuple(versions), max([t for t in last_modified if t is not None], default=None)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # 在查询前校验参数
+        self.get_expand()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # 命中缓存时同样展开
+        if response.status_code != 200 or getattr(response, 'data', None) is None or not self.get_expand():
+            return response
+        data = response.data
+        if getattr(self, 'action', None) == 'retrieve':
+            items = [data]
+        elif isinstance(data, dict):
+            items = data.get('results', [])
+        else:
+            items = data
+        role = 'admin' if request.user and request.user.is_superuser else 'user'
+        expand_items(items, self.get_expand_model(), self.get_expand(), role, request)
+        return response
@@ -0,0 +1,72 @@
+import csv
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+_export_settings = getattr(settings, 'EXPORT', {})
+
+
+class _Echo(object):
+    """
+    csv.writer写入时直接返回该行
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_fields(serializer_class):
+    """
+    序列化器中可导出的字段（不含多对多字段）
+    """
+    return [name for name, field in serializer_class().fields.items()
+            if not isinstance(field, serializers.ManyRelatedField) and not field.write_only]
+
+
+def _field_converters(serializer_class, fields):
+    # 使用序列化器字段格式化，保证与接口返回一致；外键直接返回id
+    serializer_fields = serializer_class().fields
+    converters = []
+    for name in fields:
+        field = serializer_fields[name]
+        if isinstance(field, serializers.RelatedField):
+            converters.append(None)
+        else:
+            converters.append(field.to_representation)
+    return converters
+
+
+def iter_rows(queryset, serializer_class, fields, chunk_size=None):
+    """
+    按id分块读取数据，每块一次查询，内存占用与数据总量无关
+    :return: 字典迭代器
+    """
+    chunk_size = chunk_size or _export_settings.get('CHUNK_SIZE', 2000)
+    converters = _field_converters(serializer_class, fields)
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk.values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            yield {
+                name: value if convert is None or value is None else convert(value)
+                for name, convert, value in zip(fields, converters, row[1:])
+            }
+        last_pk = rows[-1][0]
+
+
+def ndjson_stream(rows):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_stream(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(['' if row[name] is None else row[name] for name in fields])
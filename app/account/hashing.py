@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password, identify_hasher
+
+# 登录耗时统计区间（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolSaturated(Exception):
+    """
+    哈希线程池已满
+    """
+
+
+def _verify_password(password, encoded):
+    """
+    在工作线程（进程）中校验密码
+    返回 (是否正确, 需要升级时的新哈希, 哈希耗时)
+    """
+    start = time.monotonic()
+    if encoded is None:
+        # 账户不存在时同样执行一次哈希，避免通过响应时间判断账户是否存在
+        make_password(password)
+        return False, None, time.monotonic() - start
+
+    valid = check_password(password, encoded)
+    new_encoded = None
+    if valid:
+        try:
+            if identify_hasher(encoded).must_update(encoded):
+                new_encoded = make_password(password)
+        except ValueError:
+            pass
+    return valid, new_encoded, time.monotonic() - start
+
+
+class PasswordHashPool(object):
+    """
+    密码哈希线程池（进程池），限制并发数及排队长度，超出时立即拒绝
+    """
+
+    def __init__(self, workers=4, queue_size=16, executor='thread', timeout=10):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = executor
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_sum = 0.0
+        self.hash_time_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def _get_pool(self):
+        # 延迟创建，保证进程池在WSGI工作进程fork之后创建
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.executor == 'process':
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='password-hash')
+        return self._pool
+
+    def verify(self, password, encoded):
+        """
+        提交密码校验并等待结果，线程池已满时抛出PoolSaturated
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated()
+
+        start = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._get_pool().submit(_verify_password, password, encoded)
+        except Exception:
+            self._done(start, None)
+            raise
+        # 任务结束后才释放名额，等待超时的任务仍然占用线程池
+        future.add_done_callback(lambda f: self._done(start, f))
+        try:
+            valid, new_encoded, _ = future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PoolSaturated()
+        return valid, new_encoded
+
+    def _done(self, start, future):
+        latency = time.monotonic() - start
+        hash_time = 0.0
+        if future is not None and not future.cancelled() and future.exception() is None:
+            hash_time = future.result()[2]
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.latency_sum += latency
+            self.hash_time_sum += hash_time
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+        self._slots.release()
+
+    def stats(self):
+        """
+        线程池统计：排队长度、拒绝次数、耗时分布
+        """
+        with self._lock:
+            return {
+                'executor': self.executor,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.workers, 0),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'latency_sum': self.latency_sum,
+                'hash_time_sum': self.hash_time_sum,
+                'latency_buckets': dict(zip(LATENCY_BUCKETS + ('+Inf',), self.latency_buckets)),
+            }
+
+
+def authenticate(username, password):
+    """
+    与ModelBackend一致的账户认证，密码校验交由哈希线程池执行
+    :return: 认证成功返回账户，否则返回None
+    """
+    user_model = get_user_model()
+    try:
+        user = user_model._default_manager.get_by_natural_key(username)
+    except user_model.DoesNotExist:
+        hash_pool.verify(password, None)
+        return None
+
+    valid, new_encoded = hash_pool.verify(password, user.password)
+    if not valid or not user.is_active:
+        return None
+    # 哈希算法或迭代次数变化时升级密码
+    if new_encoded:
+        user.password = new_encoded
+        user.save(update_fields=['password'])
+    return user
+
+
+_hash_pool_settings = getattr(settings, 'LOGIN_HASH_POOL', {})
+
+# 登录密码哈希线程池
+hash_pool = PasswordHashPool(
+    workers=_hash_pool_settings.get('WORKERS', 4),
+    queue_size=_hash_pool_settings.get('QUEUE_SIZE', 16),
+    executor=_hash_pool_settings.get('EXECUTOR', 'thread'),
+    timeout=_hash_pool_settings.get('TIMEOUT', 10),
+)
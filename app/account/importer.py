@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import transaction, IntegrityError
+from rest_framework import serializers
+
+from app.account.cache import response_cache
+from app.account.models import RealUser, Department
+from app.account.serializers import CachedFieldsMixin
+
+_import_settings = getattr(settings, 'USER_IMPORT', {})
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+class RealUserImportSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    批量导入账户，单行校验
+    用户名唯一性及部门在分块中批量校验，避免每行查询数据库
+    """
+    password = serializers.CharField(required=False, allow_blank=True)
+    department = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    class Meta:
+        model = RealUser
+        fields = ('username', 'password', 'first_name', 'last_name', 'email', 'is_active', 'id_number', 'sex',
+                  'phone_number', 'highest_education', 'department', 'entry_date', 'leave_date')
+        extra_kwargs = {
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
+
+
+def read_rows(stream, fmt):
+    """
+    逐行读取导入数据，返回 (行号, 数据)，数据为None时表示该行无法解析
+    :param stream: 二进制或文本行迭代器
+    :param fmt: csv 或 ndjson
+    """
+    # utf-8-sig 兼容Excel导出的带BOM文件
+    lines = (line.decode('utf-8-sig' if i == 0 else 'utf-8') if isinstance(line, bytes) else line
+             for i, line in enumerate(stream))
+    if fmt == 'csv':
+        # 首行为表头
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {k: v for k, v in row.items() if k is not None and v != ''}
+    else:
+        for line_num, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+
+
+def _hash_passwords(passwords, executor, workers):
+    # 未提供密码的账户设置为不可用密码
+    passwords = [password or None for password in passwords]
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    return list(executor.map(make_password, passwords, chunksize=max(len(passwords) // (workers * 4), 1)))
+
+
+def _insert_chunk(users, lines, report):
+    """
+    批量写入一个分块，写入冲突时逐行写入定位错误行
+    """
+    try:
+        with transaction.atomic():
+            RealUser.objects.bulk_create(users)
+        report['created'] += len(users)
+    except IntegrityError:
+        for user, line_num in zip(users, lines):
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                report['created'] += 1
+            except IntegrityError as e:
+                report['errors'].append({'line': line_num, 'errors': {'non_field_errors': [str(e)]}})
+
+
+def _import_chunk(rows, departments, executor, workers, report):
+    valid = []
+    for line_num, row in rows:
+        if row is None:
+            report['errors'].append({'line': line_num, 'errors': {'non_field_errors': ['无法解析该行']}})
+            continue
+        serializer = RealUserImportSerializer(data=row)
+        if not serializer.is_valid():
+            report['errors'].append({'line': line_num, 'errors': serializer.errors})
+            continue
+        data = serializer.validated_data
+        department_name = data.pop('department', None)
+        if department_name:
+            if department_name not in departments:
+                report['errors'].append({'line': line_num, 'errors': {'department': ['部门不存在']}})
+                continue
+            data['department_id'] = departments[department_name]
+        valid.append((line_num, data))
+
+    # 分块内一次查询已存在的用户名，同时排除分块内重复的用户名
+    existing = set(RealUser.objects.filter(username__in=[data['username'] for _, data in valid])
+                   .values_list('username', flat=True))
+    rows_to_create = []
+    for line_num, data in valid:
+        if data['username'] in existing:
+            report['errors'].append({'line': line_num, 'errors': {'username': ['已存在一位使用该名字的用户。']}})
+            continue
+        existing.add(data['username'])
+        rows_to_create.append((line_num, data))
+
+    passwords = _hash_passwords([data.pop('password', None) for _, data in rows_to_create], executor, workers)
+    users = [RealUser(password=password, **data) for (_, data), password in zip(rows_to_create, passwords)]
+    _insert_chunk(users, [line_num for line_num, _ in rows_to_create], report)
+
+
+def default_workers():
+    return _import_settings.get('WORKERS') or os.cpu_count() or 1
+
+
+# (进程id, 线程池)，fork后的子进程重新创建
+_thread_executor = (None, None)
+_thread_executor_lock = threading.Lock()
+
+
+def get_thread_executor():
+    """
+    接口导入使用的哈希线程池，进程内共享，不在每个请求中创建
+    多线程的工作进程中不fork进程池；PBKDF2哈希时释放GIL，线程可以并行
+    """
+    global _thread_executor
+    with _thread_executor_lock:
+        pid, executor = _thread_executor
+        if pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=default_workers(), thread_name_prefix='import-hash')
+            _thread_executor = (os.getpid(), executor)
+        return executor
+
+
+def import_users(stream, fmt='csv', chunk_size=None, workers=None, executor=None):
+    """
+    批量导入账户
+    密码在多进程中并行哈希，部门名称一次查询，按分块bulk_create写入
+    单行错误不影响其他行
+    :param stream: 二进制或文本行迭代器（文件、请求体）
+    :param fmt: csv 或 ndjson
+    :param chunk_size: 每次写入数据库的行数，不小于1
+    :param workers: 哈希进程数，1为不使用进程池
+    :param executor: 使用已有的哈希线程池（进程池），不创建进程池，导入后不关闭
+    :return: {'created': 导入数量, 'failed': 失败数量, 'errors': [{'line': 行号, 'errors': 错误信息}]}
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError('unsupported import format: %s' % fmt)
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    chunk_size = chunk_size or _import_settings.get('CHUNK_SIZE', 1000)
+    workers = workers or default_workers()
+
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    departments = dict(Department.objects.values_list('name', 'id'))
+    rows = read_rows(stream, fmt)
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            _import_chunk(chunk, departments, executor, workers, report)
+    finally:
+        if own_executor:
+            executor.shutdown()
+        # bulk_create不会触发信号，部门汇总包含成员数
+        if report['created']:
+            response_cache.invalidate('users')
+
+    report['errors'].sort(key=lambda error: error['line'])
+    report['failed'] = len(report['errors'])
+    return report
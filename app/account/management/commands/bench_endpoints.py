@@ -0,0 +1,252 @@
+import datetime
+import json
+import math
+import platform
+import random
+import time
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from app.account.cache import response_cache
+from app.account.models import RealUser, Department
+from app.account.synthetic import generate_dataset
+
+PASSWORD = '123aaa123'
+ADMIN_USERNAME = 'bench-admin'
+
+
+class BenchContext(object):
+    """
+    压测数据：管理员客户端、token及可选的账户、部门id
+    """
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.client = APIClient()
+        self.token = None
+        self.user_ids = []
+        self.department_ids = []
+        self.created_departments = []
+        self.counter = 0
+
+    def login(self):
+        response = self.client.post(reverse('login'), {'username': ADMIN_USERNAME, 'password': PASSWORD})
+        self.token = response.data['token']
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + self.token)
+
+    def unique(self, prefix):
+        self.counter += 1
+        return '%s-%s-%s' % (prefix, int(time.time() * 1000), self.counter)
+
+    def user_id(self):
+        return self.rng.choice(self.user_ids)
+
+    def department_id(self):
+        return self.rng.choice(self.department_ids)
+
+    def id_range(self):
+        user_id = self.user_id()
+        return user_id, user_id + 100
+
+
+# (名称, 请求方法, 路径, 请求数据)
+SCENARIOS = [
+    ('login', 'post', lambda ctx: reverse('login'),
+     lambda ctx: {'username': ADMIN_USERNAME, 'password': PASSWORD}),
+    ('token-refresh', 'post', lambda ctx: reverse('refresh-token'), lambda ctx: {'token': ctx.token}),
+    ('token-verify', 'post', lambda ctx: '/api/account/token-verify/', lambda ctx: {'token': ctx.token}),
+    ('user-create', 'post', lambda ctx: reverse('user-list'),
+     lambda ctx: {'username': ctx.unique('bench'), 'password': PASSWORD}),
+    ('user-retrieve', 'get', lambda ctx: reverse('user-detail', args=[ctx.user_id()]), None),
+    ('user-update', 'patch', lambda ctx: reverse('user-detail', args=[ctx.user_id()]),
+     lambda ctx: {'first_name': ctx.unique('名')[:30]}),
+    ('user-change-password', 'post', lambda ctx: reverse('user-change_password', args=[ctx.user_id()]),
+     lambda ctx: {'password': PASSWORD}),
+    ('user-destroy', 'delete', lambda ctx: reverse('user-detail', args=[ctx.user_id()]), None),
+    ('user-id-list', 'get',
+     lambda ctx: '%s?page=%s' % (reverse('user-id-list'), ctx.rng.randint(1, max(len(ctx.user_ids) // 10, 1))),
+     None),
+    ('some-user-detail', 'get',
+     lambda ctx: '%s?id1=%s&id2=%s' % ((reverse('some-user-detail'),) + ctx.id_range()), None),
+    ('department-list', 'get', lambda ctx: reverse('department-list'), None),
+    ('department-retrieve', 'get', lambda ctx: reverse('department-detail', args=[ctx.department_id()]), None),
+    ('department-create', 'post', lambda ctx: reverse('department-list'),
+     lambda ctx: {'name': ctx.unique('部门')}),
+    ('department-update', 'patch', lambda ctx: reverse('department-detail', args=[ctx.department_id()]),
+     lambda ctx: {'name': ctx.unique('部门')}),
+    ('department-destroy', 'delete', lambda ctx: reverse('department-detail', args=[ctx.created_departments.pop()]),
+     None),
+]
+
+
+def percentile(values, p):
+    """
+    最近秩百分位数，没有数据时为0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(p * len(ordered))) - 1, 0)]
+
+
+def compare(baseline, results, threshold):
+    """
+    对比基准结果，返回回归列表
+    耗时（p50、p95）超出阈值且差值大于1ms，或平均查询数增加1次以上时视为回归
+    """
+    regressions = []
+    for size, scenarios in results.items():
+        for name, current in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            for key in ['p50_ms', 'p95_ms']:
+                if current[key] > base[key] * (1 + threshold) and current[key] - base[key] > 1:
+                    regressions.append((size, name, key, base[key], current[key]))
+            if current['queries'] >= base['queries'] + 1:
+                regressions.append((size, name, 'queries', base['queries'], current['queries']))
+    return regressions
+
+
+class Command(BaseCommand):
+    """
+    接口压测，在临时测试数据库中按不同数据量逐个请求全部接口
+    不使用接口响应缓存，重复的GET请求同样查询数据库，查询数可以与基准对比
+    """
+    help = '在临时测试数据库中压测全部账户接口，输出耗时百分位数、吞吐量及查询数，可保存并对比基准结果'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='账户数量，逗号分隔')
+        parser.add_argument('--requests', type=int, default=50, help='每个接口的请求次数')
+        parser.add_argument('--warmup', type=int, default=3, help='每个接口预热请求次数，不计入结果')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+        parser.add_argument('--only', default='', help='只压测指定接口，逗号分隔')
+        parser.add_argument('--output', help='保存结果的json文件')
+        parser.add_argument('--compare', help='对比的基准json文件')
+        parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值，默认20%%')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes 必须为逗号分隔的整数')
+        if options['requests'] < 1:
+            raise CommandError('--requests 必须大于或等于1')
+        if options['warmup'] < 0:
+            raise CommandError('--warmup 不能小于0')
+        only = [name for name in options['only'].split(',') if name]
+        unknown = set(only) - {scenario[0] for scenario in SCENARIOS}
+        if unknown:
+            raise CommandError('未知接口: %s' % ','.join(sorted(unknown)))
+        scenarios = [scenario for scenario in SCENARIOS if not only or scenario[0] in only]
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with response_cache.bypass():
+                results = self.run(sizes, scenarios, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'meta': {
+                        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'database': connection.vendor,
+                        'requests': options['requests'],
+                        'seed': options['seed'],
+                    },
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write('结果已保存至 %s' % options['output'])
+
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            for size, name, key, before, after in regressions:
+                self.stdout.write(self.style.ERROR('回归 %8s %-22s %-8s %10.2f -> %10.2f' % (
+                    size, name, key, before, after)))
+            if regressions:
+                raise CommandError('%s 项超出基准 %.0f%%' % (len(regressions), options['threshold'] * 100))
+            self.stdout.write(self.style.SUCCESS('未发现回归'))
+
+    def run(self, sizes, scenarios, options):
+        RealUser.objects.create(username=ADMIN_USERNAME, password=make_password(PASSWORD), is_superuser=True,
+                                is_staff=True)
+        results = {}
+        for size in sizes:
+            self.populate(size)
+            ctx = BenchContext(options['seed'])
+            ctx.user_ids = list(RealUser.objects.exclude(username=ADMIN_USERNAME).values_list('pk', flat=True))
+            ctx.department_ids = list(Department.objects.values_list('pk', flat=True))
+            ctx.login()
+
+            self.stdout.write('\n账户数 %s' % size)
+            self.stdout.write('%-22s %8s %9s %9s %9s %9s %8s' % (
+                'endpoint', 'requests', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'req/s', 'queries'))
+            results[str(size)] = {}
+            for name, method, path, data in scenarios:
+                result = self.bench(ctx, name, method, path, data, options['requests'], options['warmup'])
+                results[str(size)][name] = result
+                self.stdout.write('%-22s %8d %9.2f %9.2f %9.2f %9.1f %8.1f' % (
+                    name, result['requests'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                    result['throughput'], result['queries']))
+        return results
+
+    @staticmethod
+    def populate(size):
+        """
+        补足账户至指定数量，每100个账户一个部门
+        """
+        existing = RealUser.objects.count() - 1
+        if existing < size:
+            generate_dataset(size - existing, max(max(size // 100, 1) - Department.objects.count(), 0),
+                             seed=size, password=PASSWORD, prefix='bench', start=existing)
+
+    @staticmethod
+    def bench(ctx, name, method, path, data, requests, warmup):
+        latencies = []
+        queries = 0
+        statuses = set()
+        started = time.perf_counter()
+        for i in range(warmup + requests):
+            if name == 'department-destroy' and not ctx.created_departments:
+                ctx.created_departments.append(Department.objects.create(name=ctx.unique('部门')).pk)
+            url = path(ctx)
+            kwargs = {'data': data(ctx), 'format': 'json'} if data else {}
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(ctx.client, method)(url, **kwargs)
+                elapsed = time.perf_counter() - start
+            if name == 'department-create' and response.status_code == 201:
+                ctx.created_departments.append(Department.objects.get(name=response.data['name']).pk)
+            if i < warmup:
+                started = time.perf_counter()
+                continue
+            latencies.append(elapsed)
+            queries += len(captured.captured_queries)
+            statuses.add(response.status_code)
+        total = time.perf_counter() - started
+        return {
+            'requests': requests,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'throughput': requests / total if total else 0.0,
+            'queries': queries / requests,
+            'status': sorted(statuses),
+        }
@@ -0,0 +1,79 @@
+import io
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.account.compiled import get_plan
+from app.account.models import RealUser
+from app.account.parsers import FastJSONParser
+from app.account.renderers import FastJSONRenderer, orjson
+from app.account.serializers import RealUserIdListSerializer, RealUserDetailSerializer
+
+
+class Command(BaseCommand):
+    """
+    对比列表接口返回数据的JSONRenderer与FastJSONRenderer编码耗时及解析耗时
+    """
+    help = '在临时测试数据库中对比默认JSON与orjson的编码、解析耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='每页行数')
+        parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最小值')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('未安装orjson，FastJSONRenderer使用JSONRenderer'))
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            password = make_password('123aaa123')
+            RealUser.objects.bulk_create(
+                [RealUser(username='bench%s' % i, password=password, first_name='名%s' % i, sex='man',
+                          highest_education='undergraduate') for i in range(rows)]
+            )
+            request = Request(APIRequestFactory().get('/api/account/id-list/'))
+            queryset = RealUser.objects.order_by('id')
+
+            self.stdout.write('%-28s %8s %-7s %12s %12s %8s' % ('serializer', 'rows', 'step', 'json(ms)',
+                                                                 'fast(ms)', 'speedup'))
+            for serializer_class in [RealUserIdListSerializer, RealUserDetailSerializer]:
+                plan = get_plan(serializer_class, 'admin')
+                data = {'count': rows, 'next': None, 'previous': None,
+                        'results': plan.render(queryset.values(*plan.columns), request)}
+                content = JSONRenderer().render(data)
+                if FastJSONRenderer().render(data) != content:
+                    raise CommandError('%s: FastJSONRenderer结果与JSONRenderer不一致' % serializer_class.__name__)
+                if FastJSONParser().parse(io.BytesIO(content)) != JSONParser().parse(io.BytesIO(content)):
+                    raise CommandError('%s: FastJSONParser结果与JSONParser不一致' % serializer_class.__name__)
+
+                steps = [
+                    ('render', lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data)),
+                    ('parse', lambda: JSONParser().parse(io.BytesIO(content)),
+                     lambda: FastJSONParser().parse(io.BytesIO(content))),
+                ]
+                for step, default, fast in steps:
+                    default_time = self._best(default, repeat)
+                    fast_time = self._best(fast, repeat)
+                    self.stdout.write('%-28s %8d %-7s %12.1f %12.1f %7.1fx' % (
+                        serializer_class.__name__, rows, step, default_time * 1000, fast_time * 1000,
+                        default_time / fast_time))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def _best(func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
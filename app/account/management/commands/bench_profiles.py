@@ -0,0 +1,145 @@
+import datetime
+import json
+import logging
+import platform
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from app.account.management.commands.bench_endpoints import ADMIN_USERNAME, PASSWORD, compare, percentile
+from app.account.models import RealUser
+from app.account.profiles import match_profile
+
+# (名称, 使用JWT, 携带会话cookie)
+SCENARIOS = [
+    ('jwt', True, False),
+    ('jwt-session-cookie', True, True),
+    ('anonymous', False, False),
+    ('anonymous-session-cookie', False, True),
+]
+
+
+def full_profiles():
+    """
+    改动前的配置：全部路径使用admin路径的中间件及认证类
+    """
+    profile = next(item for item in settings.REQUEST_PROFILES if '/admin/'.startswith(item['PREFIX']))
+    return [dict(profile, PREFIX='/')]
+
+
+class Command(BaseCommand):
+    """
+    对比全部路径使用完整中间件（full）及按URL前缀精简（lean）时 /api/ 请求的耗时及查询数
+    """
+    help = '在临时测试数据库中对比完整及精简中间件、认证类下 /api/ 请求的耗时及查询数，可保存并对比基准结果'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='每个场景的请求次数')
+        parser.add_argument('--warmup', type=int, default=20, help='每个场景预热请求次数，不计入结果')
+        parser.add_argument('--output', help='保存结果的json文件')
+        parser.add_argument('--compare', help='对比的基准json文件')
+        parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值，默认20%%')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        # 未认证场景的401不记录日志
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            request_logger.setLevel(level)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'meta': {
+                        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'database': connection.vendor,
+                        'requests': options['requests'],
+                    },
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write('结果已保存至 %s' % options['output'])
+
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            for profile, name, key, before, after in regressions:
+                self.stdout.write(self.style.ERROR('回归 %-5s %-26s %-8s %10.3f -> %10.3f' % (
+                    profile, name, key, before, after)))
+            if regressions:
+                raise CommandError('%s 项超出基准 %.0f%%' % (len(regressions), options['threshold'] * 100))
+            self.stdout.write(self.style.SUCCESS('未发现回归'))
+
+    def run(self, options):
+        admin = RealUser.objects.create(username=ADMIN_USERNAME, password=make_password(PASSWORD),
+                                        is_superuser=True, is_staff=True)
+        url = reverse('user-detail', args=[admin.pk])
+        results = {}
+        self.stdout.write('%-5s %-26s %9s %9s %9s %8s %8s %s' % (
+            'mode', 'scenario', 'p50(ms)', 'p95(ms)', 'mean(ms)', 'queries', 'session', 'status'))
+        for mode, profiles in [('full', full_profiles()), ('lean', settings.REQUEST_PROFILES)]:
+            results[mode] = {}
+            with override_settings(REQUEST_PROFILES=profiles):
+                self.stdout.write('%-5s %s -> %s 个中间件' % (mode, url, len(match_profile(url).middleware)))
+                for name, jwt, session in SCENARIOS:
+                    # 新客户端按当前配置加载中间件
+                    client = APIClient()
+                    if jwt:
+                        response = client.post(reverse('login'), {'username': ADMIN_USERNAME, 'password': PASSWORD})
+                        client.credentials(HTTP_AUTHORIZATION='JWT ' + response.data['token'])
+                    if session:
+                        client.force_login(admin)
+                    result = self.bench(client, url, options['requests'], options['warmup'])
+                    results[mode][name] = result
+                    self.stdout.write('%-5s %-26s %9.3f %9.3f %9.3f %8.1f %8.1f %s' % (
+                        mode, name, result['p50_ms'], result['p95_ms'], result['mean_ms'], result['queries'],
+                        result['session_queries'], result['status']))
+        return results
+
+    @staticmethod
+    def bench(client, url, requests, warmup):
+        latencies = []
+        queries = 0
+        session_queries = 0
+        statuses = set()
+        for i in range(warmup + requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            latencies.append(elapsed)
+            queries += len(captured.captured_queries)
+            session_queries += sum('django_session' in query['sql'] for query in captured.captured_queries)
+            statuses.add(response.status_code)
+        return {
+            'requests': requests,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'queries': queries / requests,
+            'session_queries': session_queries / requests,
+            'status': sorted(statuses),
+        }
@@ -0,0 +1,69 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from app.account.compiled import get_plan
+from app.account.models import RealUser
+from app.account.serializers import RealUserIdListSerializer, RealUserDetailSerializer
+
+
+class Command(BaseCommand):
+    """
+    对比列表接口通用序列化与快速序列化耗时
+    """
+    help = '在临时测试数据库中对比通用序列化与快速序列化的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='每页行数')
+        parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最小值')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            password = make_password('123aaa123')
+            RealUser.objects.bulk_create(
+                [RealUser(username='bench%s' % i, password=password, first_name='名%s' % i, sex='man',
+                          highest_education='undergraduate') for i in range(rows)]
+            )
+            request = Request(APIRequestFactory().get('/api/account/id-list/'))
+            queryset = RealUser.objects.order_by('id')
+
+            self.stdout.write('%-28s %8s %12s %12s %8s' % ('serializer', 'rows', 'generic(ms)', 'compiled(ms)',
+                                                          'speedup'))
+            for serializer_class in [RealUserIdListSerializer, RealUserDetailSerializer]:
+                plan = get_plan(serializer_class, 'admin')
+
+                def generic():
+                    data = serializer_class(list(queryset), many=True, context={'request': request}).data
+                    return JSONRenderer().render(data)
+
+                def compiled():
+                    return JSONRenderer().render(plan.render(queryset.values(*plan.columns), request))
+
+                if generic() != compiled():
+                    raise CommandError('%s: 快速序列化结果与通用序列化不一致' % serializer_class.__name__)
+                generic_time = self._best(generic, repeat)
+                compiled_time = self._best(compiled, repeat)
+                self.stdout.write('%-28s %8d %12.1f %12.1f %7.1fx' % (
+                    serializer_class.__name__, rows, generic_time * 1000, compiled_time * 1000,
+                    generic_time / compiled_time))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def _best(func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,43 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.account.synthetic import generate_dataset, REFERENCE_DATE
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    """
+    生成模拟组织数据
+    """
+    help = '生成模拟部门及账户数据，相同种子生成的数据一致'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='账户数')
+        parser.add_argument('--departments', type=int, help='部门数，默认每50个账户一个部门')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+        parser.add_argument('--password', default='123aaa123', help='全部账户的密码')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每次写入数据库的行数')
+        parser.add_argument('--prefix', default='user', help='用户名及部门名称前缀，重复生成时需要不同前缀')
+        parser.add_argument('--today', type=parse_date, default=REFERENCE_DATE,
+                            help='入职、离职日期的截止日期（YYYY-MM-DD），默认 %s' % REFERENCE_DATE.isoformat())
+
+    def handle(self, *args, **options):
+        if options['users'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('--users 不能小于0，--chunk-size 必须大于0')
+        departments = options['departments']
+        if departments is None:
+            departments = max(options['users'] // 50, 1)
+
+        start = time.perf_counter()
+        result = generate_dataset(
+            options['users'], departments, seed=options['seed'], password=options['password'],
+            chunk_size=options['chunk_size'], prefix=options['prefix'], today=options['today'],
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write('生成部门 %s 个（设置主管 %s 个），账户 %s 个，耗时 %.1f 秒' % (
+            result['departments'], result['directors'], result['users'], time.perf_counter() - start))
@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.account.importer import import_users, IMPORT_FORMATS
+
+
+def positive_int(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError('必须大于或等于1')
+    return value
+
+
+class Command(BaseCommand):
+    """
+    批量导入账户
+    """
+    help = '从CSV或NDJSON文件批量导入账户，部门使用部门名称'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='导入文件路径，- 为标准输入')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None,
+                            help='文件格式，默认按扩展名判断')
+        parser.add_argument('--chunk-size', type=positive_int, default=None, help='每次写入数据库的行数')
+        parser.add_argument('--workers', type=positive_int, default=None, help='哈希密码进程数，默认为CPU核数')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path.endswith('.csv'):
+                fmt = 'csv'
+            elif path.endswith('.ndjson') or path.endswith('.jsonl'):
+                fmt = 'ndjson'
+            else:
+                raise CommandError('无法判断文件格式，请使用 --format 指定')
+
+        if path == '-':
+            report = import_users(sys.stdin.buffer, fmt, options['chunk_size'], options['workers'])
+        else:
+            with open(path, 'rb') as f:
+                report = import_users(f, fmt, options['chunk_size'], options['workers'])
+
+        for error in report['errors']:
+            self.stderr.write('line %s: %s' % (error['line'], json.dumps(error['errors'], ensure_ascii=False)))
+        self.stdout.write(self.style.SUCCESS('created: %s, failed: %s' % (report['created'], report['failed'])))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from app.account import tree
+
+
+class Command(BaseCommand):
+    """
+    重建部门层级闭包表
+    """
+    help = '按上级部门重建部门层级闭包表（导入部门或直接update上级部门后使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='数据库')
+
+    def handle(self, *args, **options):
+        try:
+            rows = tree.rebuild(options['database'])
+        except tree.TreeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write('已重建部门层级，共 %s 行' % rows)
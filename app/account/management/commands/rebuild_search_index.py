@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from app.account.search import get_backend
+
+
+class Command(BaseCommand):
+    """
+    重建账户搜索索引
+    """
+    help = '创建并重建账户搜索索引（SQLite FTS5 / MySQL FULLTEXT）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='数据库')
+
+    def handle(self, *args, **options):
+        backend = get_backend(connections[options['database']])
+        if not backend.install():
+            backend.rebuild()
+        self.stdout.write('已重建 %s 搜索索引' % type(backend).__name__)
@@ -0,0 +1,133 @@
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 在新的Python进程中加载WSGI入口并执行两次请求，输出各阶段耗时（秒）
+SCRIPT = '''
+import io, json, sys, time
+started = time.time()
+from django.conf import settings
+from app.account import warmup
+with warmup.startup_timer.phase('settings'):
+    settings.WARMUP = dict(getattr(settings, 'WARMUP', {}), ENABLED=%(warm)r, POST_FORK=False, REPORT=False)
+from dark_gold import wsgi
+# 各阶段之外的模块导入（django、项目模块等）
+imports = time.time() - started - warmup.startup_timer.total()
+if %(connect)r:
+    warmup.warm_up_worker()
+result = dict(warmup.startup_timer.phases, interpreter=started - %(spawned)r, imports=imports,
+              ready=time.time() - %(spawned)r)
+
+def request(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': False,
+        'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    start = time.perf_counter()
+    response = wsgi.application(environ, lambda status, headers, exc_info=None: None)
+    b''.join(response)
+    response.close()
+    return time.perf_counter() - start
+
+result['first_request'] = request(%(path)r)
+result['second_request'] = request(%(path)r)
+sys.stdout.write(json.dumps(result))
+'''
+
+# 输出顺序
+PHASES = ['interpreter', 'imports', 'settings', 'setup', 'handler', 'urls', 'modules', 'serializers', 'translations',
+          'connections', 'ready', 'first_request', 'second_request']
+
+
+def compare(baseline, results, threshold):
+    """
+    对比基准结果，返回回归列表
+    耗时（中位数）超出阈值且差值大于5ms时视为回归
+    """
+    regressions = []
+    for mode, phases in results.items():
+        for name, current in phases.items():
+            base = baseline.get(mode, {}).get(name)
+            if base is None:
+                continue
+            if current > base * (1 + threshold) and current - base > 5:
+                regressions.append((mode, name, base, current))
+    return regressions
+
+
+class Command(BaseCommand):
+    """
+    冷启动耗时报告：分别在未预热及预热的新进程中加载WSGI入口，输出各阶段及前两次请求的耗时
+    """
+    help = '在新进程中加载WSGI入口，输出导入、预热各阶段及首次请求耗时（毫秒），可保存并对比基准结果'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='每种模式启动次数，取中位数')
+        parser.add_argument('--path', default='/api/account/user/1/', help='请求路径（未认证）')
+        parser.add_argument('--connect', action='store_true', help='同时执行fork后的数据库连接预热')
+        parser.add_argument('--output', help='保存结果的json文件')
+        parser.add_argument('--compare', help='对比的基准json文件')
+        parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值，默认20%%')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        results = {}
+        for mode, warm in [('cold', False), ('warm', True)]:
+            runs = [self.run(warm, options) for _ in range(max(options['repeat'], 1))]
+            names = [name for name in PHASES if any(name in run for run in runs)]
+            results[mode] = {name: statistics.median(run.get(name, 0.0) for run in runs) * 1000 for name in names}
+
+        self.stdout.write('%-16s %10s %10s' % ('phase', 'cold(ms)', 'warm(ms)'))
+        for name in PHASES:
+            if name in results['cold'] or name in results['warm']:
+                self.stdout.write('%-16s %10s %10s' % (name, *[
+                    '%.1f' % results[mode][name] if name in results[mode] else '-' for mode in ['cold', 'warm']]))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'meta': {
+                        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'repeat': options['repeat'],
+                        'path': options['path'],
+                    },
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write('结果已保存至 %s' % options['output'])
+
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            for mode, name, before, after in regressions:
+                self.stdout.write(self.style.ERROR('回归 %-5s %-16s %10.1f -> %10.1f' % (mode, name, before, after)))
+            if regressions:
+                raise CommandError('%s 项超出基准 %.0f%%' % (len(regressions), options['threshold'] * 100))
+            self.stdout.write(self.style.SUCCESS('未发现回归'))
+
+    @staticmethod
+    def run(warm, options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        env['PYTHONPATH'] = os.pathsep.join([settings.BASE_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+        script = SCRIPT % {'warm': warm, 'connect': options['connect'], 'path': options['path'],
+                           'spawned': time.time()}
+        process = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise CommandError('启动失败:\n%s' % process.stderr.decode('utf-8', 'replace'))
+        return json.loads(process.stdout.decode('utf-8'))
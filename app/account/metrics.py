@@ -0,0 +1,382 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows下不加锁，开发环境只有一个进程
+    fcntl = None
+
+from app.account.audit import audit_log
+from app.account.cache import principal_cache, response_cache
+from app.account.hashing import hash_pool, LATENCY_BUCKETS as HASH_LATENCY_BUCKETS
+from app.account.pool import pool_stats
+
+# 请求耗时统计区间（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求SQL查询数统计区间
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# 数据库连接池当前状态，只合并仍在运行的进程
+POOL_GAUGES = ('size', 'in_use', 'idle', 'waiting', 'max_size')
+# 数据库连接池累计计数
+POOL_COUNTERS = ('created', 'closed', 'acquired', 'waits', 'wait_time', 'timeouts', 'health_check_failures')
+# 登录哈希线程池当前状态，只合并仍在运行的进程
+HASH_POOL_GAUGES = ('in_flight', 'queued', 'workers', 'queue_size')
+# 各进程的统计文件 account-<pid>-<启动时间>.json
+PROCESS_FILES = 'account-[0-9]*.json'
+# 已退出进程合并后的累计计数
+EXITED_FILE = 'account-exited.json'
+# 合并已退出进程时的文件锁
+LOCK_FILE = 'account.lock'
+
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _counters_only(snapshot):
+    """
+    已退出进程的连接、线程已关闭，只保留累计计数
+    """
+    snapshot['pools'] = {alias: {name: stats.get(name, 0) for name in POOL_COUNTERS}
+                         for alias, stats in snapshot.get('pools', {}).items()}
+    snapshot['login_hash'] = {name: value for name, value in snapshot.get('login_hash', {}).items()
+                              if name not in HASH_POOL_GAUGES}
+    return snapshot
+
+
+def _new_request_stats():
+    return {
+        'count': 0,
+        'latency_sum': 0.0,
+        'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'queries_buckets': [0] * (len(QUERY_BUCKETS) + 1),
+        'sql_time_sum': 0.0,
+        'response_bytes_sum': 0,
+    }
+
+
+class RequestMetrics(object):
+    """
+    按路由名称及请求方法统计请求耗时、SQL查询数、SQL耗时及响应大小
+    多进程部署时各进程定期将统计写入共享目录，读取时合并全部进程
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # fork后子进程重新统计，避免重复计算父进程的数据
+        self._pid = os.getpid()
+        self._name = '%s-%s' % (self._pid, int(time.time() * 1000))
+        self._requests = {}
+        self._responses = {}
+        self._last_flush = 0.0
+
+    def observe(self, view, method, status_code, latency, queries, sql_time, response_bytes):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            stats = self._requests.get((view, method))
+            if stats is None:
+                stats = self._requests[(view, method)] = _new_request_stats()
+            stats['count'] += 1
+            stats['latency_sum'] += latency
+            stats['latency_buckets'][_bucket_index(LATENCY_BUCKETS, latency)] += 1
+            stats['queries_sum'] += queries
+            stats['queries_buckets'][_bucket_index(QUERY_BUCKETS, queries)] += 1
+            stats['sql_time_sum'] += sql_time
+            stats['response_bytes_sum'] += response_bytes
+            key = (view, method, str(status_code))
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+            now = time.monotonic()
+            if self.directory and now - self._last_flush >= self.flush_interval:
+                self._last_flush = now
+                self._flush()
+
+    def snapshot(self):
+        """
+        当前进程的统计，可序列化为json
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return self._snapshot()
+
+    def _snapshot(self):
+        principal_stats = principal_cache.stats()
+        response_stats = response_cache.stats()
+        hash_stats = hash_pool.stats()
+        audit_stats = audit_log.stats()
+        return {
+            'requests': [[list(key), stats] for key, stats in self._requests.items()],
+            'responses': [[list(key), count] for key, count in self._responses.items()],
+            'pools': pool_stats(),
+            'login_hash': {
+                'in_flight': hash_stats['in_flight'],
+                'queued': hash_stats['queued'],
+                'workers': hash_stats['workers'],
+                'queue_size': hash_stats['queue_size'],
+                'count': hash_stats['completed'],
+                'latency_sum': hash_stats['latency_sum'],
+                'hash_time_sum': hash_stats['hash_time_sum'],
+                'latency_buckets': list(hash_stats['latency_buckets'].values()),
+            },
+            'counters': {
+                'principal_cache_hits': principal_stats['hits'],
+                'principal_cache_misses': principal_stats['misses'],
+                'principal_cache_evictions': principal_stats['evictions'],
+                'response_cache_hits': response_stats['hits'],
+                'response_cache_misses': response_stats['misses'],
+                'response_cache_coalesced': response_stats['coalesced'],
+                'login_hash_completed': hash_stats['completed'],
+                'login_hash_rejected': hash_stats['rejected'],
+                'audit_log_written': audit_stats['written'],
+                'audit_log_failed': audit_stats['failed'],
+                'audit_log_blocked': audit_stats['blocked'],
+                'audit_log_sync_writes': audit_stats['sync_writes'],
+            },
+        }
+
+    def _flush(self):
+        # 先写入临时文件再替换，读取时不会读到写入一半的文件
+        path = os.path.join(self.directory, 'account-%s.json' % self._name)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            self._last_flush = time.monotonic()
+            self._flush()
+
+    def collect(self):
+        """
+        合并全部进程的统计
+        已退出进程的计数合并到同一个文件后删除其文件，计数不会因工作进程重启而减少
+        """
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = os.path.join(self.directory, 'account-%s.json' % self._name)
+            exited = []
+            for path in glob.glob(os.path.join(self.directory, PROCESS_FILES)):
+                if path == own:
+                    continue
+                try:
+                    pid = int(os.path.basename(path).split('-')[1])
+                except (ValueError, IndexError):
+                    continue
+                if not _process_alive(pid):
+                    exited.append(path)
+                    continue
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            if exited:
+                self._fold(exited)
+            snapshot = _read_snapshot(os.path.join(self.directory, EXITED_FILE))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return merge_snapshots(snapshots)
+
+    def _fold(self, paths):
+        """
+        已退出进程的统计合并到EXITED_FILE并删除其文件，目录中的文件数及读取耗时不随工作进程重启增长
+        多个进程同时读取时使用文件锁，已合并的文件名记录在EXITED_FILE中，删除失败时不会重复合并
+        """
+        exited_path = os.path.join(self.directory, EXITED_FILE)
+        try:
+            with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                exited = _read_snapshot(exited_path) or {}
+                folded = set(exited.get('folded', []))
+                snapshots = [exited] if exited else []
+                for path in paths:
+                    name = os.path.basename(path)
+                    snapshot = None if name in folded else _read_snapshot(path)
+                    if snapshot is not None:
+                        snapshots.append(_counters_only(snapshot))
+                        folded.add(name)
+                merged = merge_snapshots(snapshots)
+                merged['requests'] = [[list(key), stats] for key, stats in merged['requests'].items()]
+                merged['responses'] = [[list(key), count] for key, count in merged['responses'].items()]
+                # 只记录仍未删除的文件
+                merged['folded'] = sorted(name for name in folded
+                                          if os.path.exists(os.path.join(self.directory, name)))
+                tmp_path = '%s.%s.tmp' % (exited_path, os.getpid())
+                with open(tmp_path, 'w') as f:
+                    json.dump(merged, f)
+                os.replace(tmp_path, exited_path)
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        except OSError:
+            pass
+
+
+def merge_snapshots(snapshots):
+    requests = {}
+    responses = {}
+    pools = {}
+    login_hash = {name: 0 for name in HASH_POOL_GAUGES + ('count', 'latency_sum', 'hash_time_sum')}
+    login_hash['latency_buckets'] = [0] * (len(HASH_LATENCY_BUCKETS) + 1)
+    counters = {}
+    for snapshot in snapshots:
+        for key, stats in snapshot['requests']:
+            merged = requests.setdefault(tuple(key), _new_request_stats())
+            for name, value in stats.items():
+                if isinstance(value, list):
+                    merged[name] = [a + b for a, b in zip(merged[name], value)]
+                else:
+                    merged[name] += value
+        for key, count in snapshot['responses']:
+            responses[tuple(key)] = responses.get(tuple(key), 0) + count
+        for alias, stats in snapshot.get('pools', {}).items():
+            merged = pools.setdefault(alias, {})
+            for name, value in stats.items():
+                merged[name] = merged.get(name, 0) + value
+        for name, value in snapshot.get('login_hash', {}).items():
+            if isinstance(value, list):
+                login_hash[name] = [a + b for a, b in zip(login_hash[name], value)]
+            else:
+                login_hash[name] += value
+        for name, value in snapshot['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    return {'requests': requests, 'responses': responses, 'pools': pools, 'login_hash': login_hash,
+            'counters': counters}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels.items())
+
+
+def _histogram(lines, name, buckets, counts, total, count, **labels):
+    cumulative = 0
+    for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+        cumulative += bucket_count
+        lines.append('%s_bucket%s %s' % (name, _labels(**labels, le=bound), cumulative))
+    lines.append('%s_sum%s %s' % (name, _labels(**labels), total))
+    lines.append('%s_count%s %s' % (name, _labels(**labels), count))
+
+
+def render_prometheus(metrics):
+    """
+    合并后的统计 -> Prometheus文本格式
+    """
+    requests = sorted(metrics['requests'].items())
+    lines = [
+        '# HELP account_http_request_duration_seconds Request latency by view and method.',
+        '# TYPE account_http_request_duration_seconds histogram',
+    ]
+    for (view, method), stats in requests:
+        _histogram(lines, 'account_http_request_duration_seconds', LATENCY_BUCKETS, stats['latency_buckets'],
+                   stats['latency_sum'], stats['count'], view=view, method=method)
+
+    lines += [
+        '# HELP account_http_request_queries SQL queries per request by view and method.',
+        '# TYPE account_http_request_queries histogram',
+    ]
+    for (view, method), stats in requests:
+        _histogram(lines, 'account_http_request_queries', QUERY_BUCKETS, stats['queries_buckets'],
+                   stats['queries_sum'], stats['count'], view=view, method=method)
+
+    for name, key, help_text in [
+        ('account_http_sql_duration_seconds_total', 'sql_time_sum', 'Time spent in SQL by view and method.'),
+        ('account_http_response_bytes_total', 'response_bytes_sum', 'Response body bytes by view and method.'),
+    ]:
+        lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s counter' % name]
+        for (view, method), stats in requests:
+            lines.append('%s%s %s' % (name, _labels(view=view, method=method), stats[key]))
+
+    lines += [
+        '# HELP account_http_responses_total Responses by view, method and status code.',
+        '# TYPE account_http_responses_total counter',
+    ]
+    for (view, method, status_code), count in sorted(metrics['responses'].items()):
+        lines.append('account_http_responses_total%s %s' % (
+            _labels(view=view, method=method, status=status_code), count))
+
+    pools = sorted(metrics.get('pools', {}).items())
+    for name in POOL_GAUGES:
+        lines.append('# TYPE account_db_pool_%s gauge' % name)
+        for alias, stats in pools:
+            lines.append('account_db_pool_%s%s %s' % (name, _labels(database=alias), stats.get(name, 0)))
+    for name in POOL_COUNTERS:
+        lines.append('# TYPE account_db_pool_%s_total counter' % name)
+        for alias, stats in pools:
+            lines.append('account_db_pool_%s_total%s %s' % (name, _labels(database=alias), stats.get(name, 0)))
+
+    login_hash = metrics.get('login_hash')
+    if login_hash:
+        for name in HASH_POOL_GAUGES:
+            lines += ['# TYPE account_login_hash_%s gauge' % name,
+                      'account_login_hash_%s %s' % (name, login_hash[name])]
+        lines += [
+            '# HELP account_login_hash_duration_seconds Login password hash latency including queue wait.',
+            '# TYPE account_login_hash_duration_seconds histogram',
+        ]
+        _histogram(lines, 'account_login_hash_duration_seconds', HASH_LATENCY_BUCKETS,
+                   login_hash['latency_buckets'], login_hash['latency_sum'], login_hash['count'])
+        lines += ['# TYPE account_login_hash_time_seconds_total counter',
+                  'account_login_hash_time_seconds_total %s' % login_hash['hash_time_sum']]
+
+    for name, value in sorted(metrics['counters'].items()):
+        lines += ['# TYPE account_%s_total counter' % name, 'account_%s_total %s' % (name, value)]
+    return '\n'.join(lines) + '\n'
+
+
+_metrics_settings = getattr(settings, 'METRICS', {})
+
+# 请求指标，每个进程一份
+request_metrics = RequestMetrics(
+    directory=_metrics_settings.get('DIRECTORY'),
+    flush_interval=_metrics_settings.get('FLUSH_INTERVAL', 5),
+)
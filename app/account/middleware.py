@@ -0,0 +1,185 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, ImproperlyConfigured
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from app.account import routers
+from app.account.metrics import request_metrics
+from app.account.profiles import get_profiles
+
+
+class _QueryRecorder(object):
+    """
+    记录请求中的SQL查询数及耗时
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def instrument(self):
+        return _Instrument(self)
+
+
+class _Instrument(object):
+    # 所有数据库连接都记录
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.wrappers = []
+
+    def __enter__(self):
+        for connection in connections.all():
+            wrapper = connection.execute_wrapper(self.recorder)
+            wrapper.__enter__()
+            self.wrappers.append(wrapper)
+
+    def __exit__(self, *exc_info):
+        while self.wrappers:
+            self.wrappers.pop().__exit__(*exc_info)
+
+
+class RequestMetricsMiddleware(object):
+    """
+    按路由名称及请求方法统计请求耗时、SQL查询数、SQL耗时及响应大小
+    流式响应在输出完成后统计
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS', {}).get('ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        recorder = _QueryRecorder()
+        with recorder.instrument():
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self._stream(request, response, response.streaming_content, recorder, start)
+        else:
+            self._observe(request, response, recorder, start, len(response.content))
+        return response
+
+    def _stream(self, request, response, content, recorder, start):
+        size = 0
+        try:
+            with recorder.instrument():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._observe(request, response, recorder, start, size)
+
+    @staticmethod
+    def _observe(request, response, recorder, start, size):
+        # 未匹配路由的请求合并统计，避免任意路径产生大量指标
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else '<unresolved>'
+        request_metrics.observe(view, request.method, response.status_code, time.perf_counter() - start,
+                                recorder.queries, recorder.sql_time, size)
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    读写分离的请求状态：非安全方法请求全部使用主库；请求中写入数据库时，记录当前账户在粘滞时间内从主库读取
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        try:
+            # 更新前读取的实例从主库读取，避免以副本中的旧数据覆盖
+            routers.route_request(request.method)
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if routers.has_written() and user is not None and user.is_authenticated:
+                routers.stick(user.pk)
+            return response
+        finally:
+            routers.reset()
+
+
+class _MiddlewareChain(object):
+    """
+    一组中间件，加载方式与Django的BaseHandler.load_middleware一致
+    """
+
+    def __init__(self, paths, get_response):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = get_response
+        for path in reversed(paths):
+            middleware = import_string(path)
+            try:
+                instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if instance is None:
+                raise ImproperlyConfigured('Middleware factory %s returned None.' % path)
+            if hasattr(instance, 'process_view'):
+                self.view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self.template_response_middleware.append(instance.process_template_response)
+            if hasattr(instance, 'process_exception'):
+                self.exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self.handler = handler
+
+
+class RequestProfileMiddleware(object):
+    """
+    按URL前缀（settings.REQUEST_PROFILES）执行不同的中间件，按顺序匹配第一个前缀，没有匹配时不执行
+    例如 /api/ 只使用JWT认证，不需要会话、CSRF、消息等中间件；/admin/ 使用完整的中间件
+    """
+
+    def __init__(self, get_response):
+        self.chains = [(profile.prefix, _MiddlewareChain(profile.middleware, get_response))
+                       for profile in get_profiles()]
+        self.default = _MiddlewareChain([], get_response)
+
+    def get_chain(self, request):
+        for prefix, chain in self.chains:
+            if request.path_info.startswith(prefix):
+                return chain
+        return self.default
+
+    def __call__(self, request):
+        return self.get_chain(request).handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for method in self.get_chain(request).view_middleware:
+            response = method(request, view_func, view_args, view_kwargs)
+            if response:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        for method in self.get_chain(request).template_response_middleware:
+            response = method(request, response)
+            if response is None:
+                raise ValueError('%s.process_template_response didn\'t return an HttpResponse object. '
+                                 'It returned None instead.' % (method.__self__.__class__.__name__,))
+        return response
+
+    def process_exception(self, request, exception):
+        for method in self.get_chain(request).exception_middleware:
+            response = method(request, exception)
+            if response:
+                return response
+        return None
@@ -33,11 +33,50 @@ class Department(models.Model):
     director = models.ForeignKey('RealUser', verbose_name='部门主管', on_delete=models.SET_NULL, null=True, blank=True,
                                  related_name='director_user')
     '''部门主管'''
+    update_time = models.DateTimeField('''更新时间''', auto_now=True, null=True, db_index=True)
+    '''更新时间，用于ETag/Last-Modified'''
+    parent = models.ForeignKey('self', verbose_name='上级部门', on_delete=models.DO_NOTHING, null=True, blank=True,
+                               related_name='children')
+    '''上级部门，删除部门时下级部门移至其上级部门（app.account.tree）'''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 加载时的上级部门，保存时判断是否移动
+        if 'parent_id' in instance.__dict__:
+            instance._loaded_parent_id = instance.parent_id
+        return instance
 
     def __str__(self):
         return self.name
 
 
+# 部门层级闭包表
+class DepartmentClosure(models.Model):
+    """
+    部门层级闭包表，每个部门与其自身及全部上级部门各一行
+    由 app.account.tree 在部门添加、移动、删除时维护
+    """
+
+    class Meta:
+        verbose_name = '部门层级'
+        verbose_name_plural = '部门层级'
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            # 按下级部门查询上级部门链，按层级排序
+            models.Index(fields=['descendant', 'depth'], name='dept_closure_descendant'),
+        ]
+
+    ancestor = models.ForeignKey(Department, verbose_name='上级部门', on_delete=models.CASCADE, db_index=False,
+                                 related_name='descendant_links')
+    '''上级部门（包括自身），按上级部门查询子树使用唯一索引'''
+    descendant = models.ForeignKey(Department, verbose_name='下级部门', on_delete=models.CASCADE, db_index=False,
+                                   related_name='ancestor_links')
+    '''下级部门（包括自身）'''
+    depth = models.PositiveIntegerField('''层级差''')
+    '''层级差，自身为0，直接下级为1'''
+
+
 # 扩展User属性
 class RealUser(AbstractUser):
     """
@@ -60,9 +99,57 @@ class RealUser(AbstractUser):
     '''离职日期'''
     jwt_deadline = models.BigIntegerField('''JWT过期时间''', default=0, null=True, blank=True)
     '''JWT过期时间，默认不过期，更改密码时改为当前时间'''
+    update_time = models.DateTimeField('''更新时间''', auto_now=True, null=True, db_index=True)
+    '''更新时间，用于ETag/Last-Modified'''
 
     def __str__(self):
         return ' '.join([
             str(self.get_username()),
             str(self.get_full_name())
         ])
+
+
+AUDIT_ACTIONS = (
+    ('create', '创建'),
+    ('update', '更新'),
+    ('change_password', '更改密码'),
+    ('deactivate', '停用'),
+    ('delete', '删除'),
+)
+
+AUDIT_TARGET_TYPES = (
+    ('user', '账户'),
+    ('department', '部门'),
+)
+
+
+# 审计日志
+class AuditLog(models.Model):
+    """
+    账户及部门修改记录，由后台线程批量写入
+    """
+
+    class Meta:
+        verbose_name = '审计日志'
+        verbose_name_plural = '审计日志'
+        indexes = [
+            # 按操作账户、修改对象查询，按时间排序及筛选
+            models.Index(fields=['actor_id', 'created_time'], name='audit_actor_time'),
+            models.Index(fields=['target_type', 'target_id', 'created_time'], name='audit_target_time'),
+        ]
+
+    actor_id = models.IntegerField('''操作账户id''', null=True, blank=True)
+    '''操作账户id，未登录（注册等）时为空；不使用外键，批量写入不检查约束'''
+    action = models.CharField('''操作''', choices=AUDIT_ACTIONS, max_length=20)
+    '''操作'''
+    target_type = models.CharField('''对象类型''', choices=AUDIT_TARGET_TYPES, max_length=20)
+    '''对象类型'''
+    target_id = models.IntegerField('''对象id''')
+    '''对象id'''
+    changes = models.TextField('''修改内容''', default='{}')
+    '''修改内容，json格式 {字段: [修改前, 修改后]}，密码等字段只记录是否修改'''
+    created_time = models.DateTimeField('''操作时间''', db_index=True)
+    '''操作时间，请求中记录的时间，不是写入时间'''
+
+    def __str__(self):
+        return '%s %s %s:%s' % (self.actor_id, self.action, self.target_type, self.target_id)
@@ -0,0 +1,25 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from app.account.renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON，安装orjson时使用orjson解析，结果与JSONParser一致
+    非UTF-8编码、STRICT_JSON为False及orjson不支持的内容（超过64位的整数等）使用JSONParser，解析错误信息同样一致
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        content = stream.read()
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(content), media_type, parser_context)
@@ -0,0 +1,320 @@
+import collections
+import functools
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.utils import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """
+    等待连接超时
+    """
+
+
+class _PooledConnection(object):
+    __slots__ = ('connection', 'created', 'last_used')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.last_used = time.monotonic()
+
+
+class ConnectionPool(object):
+    """
+    数据库连接池，线程安全
+    取出时检查连接存活时间及可用性，连接已满时等待归还，超时抛出PoolTimeout
+    """
+
+    def __init__(self, connect, check=None, name='default', min_size=0, max_size=10, max_lifetime=1800,
+                 max_idle=600, timeout=10, health_check_interval=0):
+        """
+        :param connect: 新建连接的函数
+        :param check: 检查连接是否可用的函数，不可用时抛出异常
+        :param min_size: 最少保持的连接数，第一次取出连接时创建
+        :param max_size: 最大连接数
+        :param max_lifetime: 连接最长使用时间（秒）
+        :param max_idle: 超出min_size的连接空闲多久（秒）后关闭
+        :param timeout: 等待连接的最长时间（秒）
+        :param health_check_interval: 连接空闲超过此时间（秒）时取出前检查，0为每次检查
+        """
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._connect = connect
+        self._check = check
+        self._condition = threading.Condition()
+        # 最近归还的连接在右侧
+        self._idle = collections.deque()
+        self._in_use = {}
+        self._filled = False
+        self.size = 0
+        self.waiting = 0
+        self.created = 0
+        self.closed = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    def acquire(self):
+        """
+        取出连接
+        """
+        if not self._filled:
+            self.fill()
+        start = time.monotonic()
+        while True:
+            record = self._take(start)
+            # 没有空闲连接，已预留名额
+            if record is None:
+                record = self._open()
+                break
+            if self._usable(record):
+                break
+        with self._condition:
+            self._in_use[id(record.connection)] = record
+            self.acquired += 1
+        return record.connection
+
+    def release(self, connection, discard=False):
+        """
+        归还连接
+        :param discard: 关闭连接，不再使用
+        """
+        with self._condition:
+            record = self._in_use.pop(id(connection), None)
+        if record is None:
+            return
+        if discard:
+            return self._discard(record)
+
+        now = time.monotonic()
+        record.last_used = now
+        expired = []
+        with self._condition:
+            self._idle.append(record)
+            # 关闭空闲过久的连接，保留min_size个
+            while self._idle and self.size - len(expired) > self.min_size \
+                    and now - self._idle[0].last_used >= self.max_idle:
+                expired.append(self._idle.popleft())
+            self._condition.notify()
+        for record in expired:
+            self._discard(record)
+
+    def fill(self):
+        """
+        创建连接至min_size个
+        """
+        self._filled = True
+        while True:
+            with self._condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            record = self._open()
+            with self._condition:
+                self._idle.appendleft(record)
+                self._condition.notify()
+
+    def _take(self, start):
+        """
+        取出空闲连接；没有空闲连接且未满时预留名额返回None；已满时等待
+        """
+        with self._condition:
+            waited = False
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None
+                now = time.monotonic()
+                remaining = self.timeout - (now - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout('database connection pool %r exhausted (%s connections), waited %.2fs'
+                                      % (self.name, self.max_size, now - start))
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                self.waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    self.wait_time += time.monotonic() - now
+
+    def _open(self):
+        try:
+            connection = self._connect()
+        except BaseException:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.created += 1
+        return _PooledConnection(connection)
+
+    def _usable(self, record):
+        now = time.monotonic()
+        if now - record.created >= self.max_lifetime:
+            self._discard(record)
+            return False
+        if self._check is not None and now - record.last_used >= self.health_check_interval:
+            try:
+                self._check(record.connection)
+            except Exception:
+                with self._condition:
+                    self.health_check_failures += 1
+                self._discard(record)
+                return False
+        return True
+
+    def _discard(self, record):
+        try:
+            record.connection.close()
+        except Exception:
+            pass
+        with self._condition:
+            self.size -= 1
+            self.closed += 1
+            self._condition.notify()
+
+    def close(self):
+        """
+        关闭全部空闲连接
+        """
+        with self._condition:
+            idle, self._idle = list(self._idle), collections.deque()
+        for record in idle:
+            self._discard(record)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self.waiting,
+                'max_size': self.max_size,
+                'created': self.created,
+                'closed': self.closed,
+                'acquired': self.acquired,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'timeouts': self.timeouts,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(key, factory):
+    """
+    按数据库及连接参数取连接池，每个进程一份
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # fork后不使用父进程的连接
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def pool_stats():
+    """
+    当前进程全部连接池的统计，按数据库别名合并
+    """
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    stats = {}
+    for pool in pools:
+        merged = stats.setdefault(pool.name, {})
+        for name, value in pool.stats().items():
+            merged[name] = merged.get(name, 0) + value
+    return stats
+
+
+def close_pools():
+    """
+    关闭全部连接池的空闲连接
+    """
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        pool.close()
+
+
+class PooledDatabaseWrapperMixin(object):
+    """
+    DatabaseWrapper使用连接池：新建连接时从连接池取出，关闭连接时归还
+    连接池参数为settings.DATABASE_POOL，可在DATABASES中的POOL覆盖
+    """
+
+    _pool = None
+
+    def pool_options(self):
+        options = dict(getattr(settings, 'DATABASE_POOL', {}))
+        options.update(self.settings_dict.get('POOL') or {})
+        return options
+
+    def pool_enabled(self):
+        return self.pool_options().get('ENABLED', True)
+
+    def check_pooled_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_enabled():
+            return super().get_new_connection(conn_params)
+        connect = functools.partial(super().get_new_connection, conn_params)
+        options = self.pool_options()
+        # 连接参数不同时（如测试数据库）使用不同的连接池
+        key = (self.alias, repr(sorted(conn_params.items())))
+        pool = get_pool(key, lambda: ConnectionPool(
+            connect,
+            check=self.check_pooled_connection,
+            name=self.alias,
+            min_size=options.get('MIN_SIZE', 0),
+            max_size=options.get('MAX_SIZE', 10),
+            max_lifetime=options.get('MAX_LIFETIME', 1800),
+            max_idle=options.get('MAX_IDLE', 600),
+            timeout=options.get('TIMEOUT', 10),
+            health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 0),
+        ))
+        connection = pool.acquire()
+        self._pool = pool
+        return connection
+
+    def _close(self):
+        pool, self._pool = self._pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # 事务中关闭或发生错误的连接不再使用，未提交的事务回滚后归还
+        discard = self.in_atomic_block or self.errors_occurred
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Exception:
+                discard = True
+        pool.release(self.connection, discard=discard)
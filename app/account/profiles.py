@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class RequestProfile(object):
+    """
+    URL前缀对应的中间件及DRF认证类
+    """
+
+    def __init__(self, prefix, middleware, authentication_classes):
+        self.prefix = prefix
+        self.middleware = list(middleware)
+        self.authentication_classes = [import_string(path) if isinstance(path, str) else path
+                                       for path in authentication_classes]
+
+    def get_authenticators(self):
+        return [authentication_class() for authentication_class in self.authentication_classes]
+
+
+# (settings.REQUEST_PROFILES, 解析后的配置)，设置变化（测试中覆盖）时重新解析
+_profiles = (None, [])
+
+
+def get_profiles():
+    global _profiles
+    value = getattr(settings, 'REQUEST_PROFILES', [])
+    if _profiles[0] is not value:
+        _profiles = (value, [RequestProfile(item['PREFIX'], item.get('MIDDLEWARE', []),
+                                            item.get('AUTHENTICATION_CLASSES', [])) for item in value])
+    return _profiles[1]
+
+
+def match_profile(path):
+    """
+    按顺序匹配第一个前缀，没有匹配时返回None
+    """
+    for profile in get_profiles():
+        if path.startswith(profile.prefix):
+            return profile
+    return None
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON，安装orjson时使用orjson编码，返回内容与JSONRenderer一致
+    日期时间、Decimal、延迟翻译字符串等仍由JSONEncoder转换
+    缩进输出（可浏览API）、非默认的UNICODE_JSON/COMPACT_JSON/STRICT_JSON设置及orjson不支持的数据
+    （超过64位的整数、非字符串key等）使用JSONRenderer
+    浮点数使用科学计数法时格式不同（1e16 / 1e+16），NaN/Infinity返回null（JSONRenderer抛出异常），目前接口不返回浮点数
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if orjson is None or self.ensure_ascii or not self.compact or not self.strict or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # 与JSONRenderer一致，转义U+2028/U+2029
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    NDJSON，每行一个JSON对象
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(
+            json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n' for row in rows
+        ).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV，首行为表头
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        if rows:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    Prometheus文本格式，错误信息按JSON返回
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, str):
+            data = json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+        return data.encode(self.charset)
@@ -0,0 +1,121 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 请求内的路由状态，每个线程一份
+_state = threading.local()
+
+
+def _replica_settings():
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def replica_aliases():
+    return _replica_settings().get('ALIASES', [])
+
+
+def sticky_cache_alias():
+    """
+    记录写入的缓存，多进程部署时需要为共享缓存
+    """
+    return _replica_settings().get('CACHE_ALIAS', 'default')
+
+
+def reset():
+    """
+    请求开始及结束时清除路由状态
+    """
+    _state.primary = False
+    _state.wrote = False
+
+
+def route_request(method):
+    """
+    按请求方法设置路由：非安全方法请求全部使用主库，已写入的状态保留
+    """
+    _state.primary = method not in SAFE_METHODS
+
+
+def pin_primary():
+    """
+    当前请求剩余的读取全部使用主库
+    """
+    _state.primary = True
+
+
+def is_pinned():
+    return getattr(_state, 'primary', False) or getattr(_state, 'wrote', False)
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+def _sticky_key(user_id):
+    return 'account:primary:user:%s' % user_id
+
+
+def stick(*user_ids):
+    """
+    写入后一段时间内，这些账户的请求从主库读取
+    """
+    if not replica_aliases() or not user_ids:
+        return
+    caches[sticky_cache_alias()].set_many(
+        {_sticky_key(user_id): 1 for user_id in user_ids}, _replica_settings().get('STICKY_SECONDS', 5))
+
+
+def pin_if_sticky(user_id):
+    """
+    账户在写入后的粘滞时间内时，当前请求从主库读取
+    :return: 是否使用主库
+    """
+    if is_pinned():
+        return True
+    if user_id is None or not replica_aliases():
+        return False
+    if caches[sticky_cache_alias()].get(_sticky_key(user_id)):
+        pin_primary()
+        return True
+    return False
+
+
+class ReplicaRouter(object):
+    """
+    读写分离：写入使用主库，读取随机使用只读副本
+    当前请求（或线程）已写入、非安全方法请求或账户在写入后的粘滞时间内时，读取使用主库
+    select_for_update按写入路由，使用主库
+    未配置副本时不处理，全部使用default
+    """
+
+    def db_for_read(self, model, **hints):
+        aliases = replica_aliases()
+        if not aliases:
+            return None
+        if is_pinned():
+            return DEFAULT_DB_ALIAS
+        # 关联对象从读取实例的数据库读取
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in aliases:
+            return instance._state.db
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if not replica_aliases():
+            return None
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS}.union(replica_aliases())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,219 @@
+import base64
+import json
+import re
+
+from django.db.models import Q
+
+from app.account.models import RealUser
+
+# 搜索的字段
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'phone_number', 'id_number')
+
+
+def split_terms(query):
+    """
+    搜索词按空白分隔，最多10个
+    """
+    return query.split()[:10]
+
+
+def encode_cursor(score, pk):
+    return base64.urlsafe_b64encode(json.dumps([score, pk]).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    :return: (分数, 主键)，无法解析时抛出ValueError
+    """
+    try:
+        score, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(score, (int, float)) or not isinstance(pk, int):
+        raise ValueError('invalid cursor')
+    return score, pk
+
+
+class SQLiteSearchBackend(object):
+    """
+    SQLite FTS5全文索引
+    索引表保存用户名、姓名、全名（姓+名）、手机号、身份证号，由触发器与账户表同步，包括bulk_create及update
+    """
+    table = 'account_realuser_search'
+    source = 'account_realuser'
+    # 匹配字段权重：用户名、全名、名、姓、手机号、身份证号
+    weights = (10.0, 5.0, 2.0, 2.0, 1.0, 1.0)
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _values(self, row):
+        return "{row}.username, coalesce({row}.last_name, '') || coalesce({row}.first_name, ''), " \
+               "{row}.first_name, {row}.last_name, {row}.phone_number, {row}.id_number".format(row=row)
+
+    def _triggers(self):
+        columns = 'rowid, username, full_name, first_name, last_name, phone_number, id_number'
+        insert = 'INSERT INTO {table}({columns}) VALUES (new.id, {values});'.format(
+            table=self.table, columns=columns, values=self._values('new'))
+        delete = 'DELETE FROM {table} WHERE rowid = old.id;'.format(table=self.table)
+        return {
+            self.table + '_ai': 'AFTER INSERT ON {source} BEGIN {insert} END'.format(
+                source=self.source, insert=insert),
+            self.table + '_ad': 'AFTER DELETE ON {source} BEGIN {delete} END'.format(
+                source=self.source, delete=delete),
+            self.table + '_au': 'AFTER UPDATE OF username, first_name, last_name, phone_number, id_number '
+                                'ON {source} BEGIN {delete} {insert} END'.format(
+                                    source=self.source, delete=delete, insert=insert),
+        }
+
+    def install(self):
+        """
+        创建索引表及触发器，已存在时不处理
+        SQLite修改表结构时会重建账户表并删除触发器，缺少触发器时重建索引
+        :return: 是否重建了索引
+        """
+        triggers = self._triggers()
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name IN (%s)" % ', '.join(['%s'] * 4),
+                           [self.table] + list(triggers))
+            existing = {row[0] for row in cursor.fetchall()}
+            if len(existing) == 4:
+                return False
+            if self.table not in existing:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE {table} USING fts5("
+                    "username, full_name, first_name, last_name, phone_number, id_number, "
+                    "tokenize = 'unicode61', prefix = '2 3')".format(table=self.table))
+                cursor.execute("INSERT INTO {table}({table}, rank) VALUES ('rank', %s)".format(table=self.table),
+                               ['bm25(%s)' % ', '.join(str(weight) for weight in self.weights)])
+            for name, sql in triggers.items():
+                if name not in existing:
+                    cursor.execute('CREATE TRIGGER {name} {sql}'.format(name=name, sql=sql))
+        self.rebuild()
+        return True
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {table}'.format(table=self.table))
+            cursor.execute(
+                'INSERT INTO {table}(rowid, username, full_name, first_name, last_name, phone_number, id_number) '
+                'SELECT {source}.id, {values} FROM {source}'.format(
+                    table=self.table, source=self.source, values=self._values(self.source)))
+
+    @staticmethod
+    def match_expression(terms):
+        # 每个词作为字符串前缀匹配，避免用户输入被解析为FTS5语法
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def search(self, terms, department=None, after=None, limit=20):
+        """
+        :return: [(分数, 主键)]，按相关度排序，分数越小越相关
+        """
+        # 不筛选部门时只查询索引表
+        sql = ['SELECT s.rank, s.rowid FROM {table} s'.format(table=self.table)]
+        if department is not None:
+            sql.append('JOIN {source} u ON u.id = s.rowid'.format(source=self.source))
+        sql.append('WHERE {table} MATCH %s'.format(table=self.table))
+        params = [self.match_expression(terms)]
+        if department is not None:
+            sql.append('AND u.department_id = %s')
+            params.append(department)
+        if after is not None:
+            sql.append('AND (s.rank > %s OR (s.rank = %s AND s.rowid > %s))')
+            params += [after[0], after[0], after[1]]
+        sql.append('ORDER BY s.rank, s.rowid LIMIT %s')
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+
+class MySQLSearchBackend(object):
+    """
+    MySQL FULLTEXT索引（ngram分词，支持中文），布尔模式前缀匹配
+    """
+    index = 'account_realuser_search'
+    source = 'account_realuser'
+    # 特殊字符在布尔模式中有语法含义
+    special = re.compile(r'[+\-<>()~*"@]+')
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() '
+                           'AND table_name = %s AND index_name = %s', [self.source, self.index])
+            if cursor.fetchone()[0]:
+                return False
+            cursor.execute('ALTER TABLE {source} ADD FULLTEXT INDEX {index} ({columns}) WITH PARSER ngram'.format(
+                source=self.source, index=self.index, columns=', '.join(SEARCH_FIELDS)))
+        return True
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('OPTIMIZE TABLE {source}'.format(source=self.source))
+
+    def match_expression(self, terms):
+        terms = [self.special.sub(' ', term).strip() for term in terms]
+        return ' '.join('+%s*' % term for term in terms if term)
+
+    def search(self, terms, department=None, after=None, limit=20):
+        """
+        :return: [(分数, 主键)]，按相关度排序，分数越大越相关
+        """
+        expression = self.match_expression(terms)
+        if not expression:
+            return []
+        match = 'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)'.format(columns=', '.join(SEARCH_FIELDS))
+        sql = ['SELECT {match} AS score, id FROM {source} WHERE {match}'.format(match=match, source=self.source)]
+        params = [expression, expression]
+        if department is not None:
+            sql.append('AND department_id = %s')
+            params.append(department)
+        if after is not None:
+            sql.append('HAVING score < %s OR (score = %s AND id > %s)')
+            params += [after[0], after[0], after[1]]
+        sql.append('ORDER BY score DESC, id LIMIT %s')
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend(object):
+    """
+    其他数据库，按字段前缀查询，不使用全文索引，按id排序
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self):
+        return False
+
+    def rebuild(self):
+        pass
+
+    def search(self, terms, department=None, after=None, limit=20):
+        queryset = RealUser.objects.using(self.connection.alias)
+        for term in terms:
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{field + '__istartswith': term})
+            queryset = queryset.filter(condition)
+        if department is not None:
+            queryset = queryset.filter(department_id=department)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after[1])
+        return [(0, pk) for pk in queryset.order_by('pk').values_list('pk', flat=True)[:limit]]
+
+
+_backends = {
+    'sqlite': SQLiteSearchBackend,
+    'mysql': MySQLSearchBackend,
+}
+
+
+def get_backend(connection):
+    return _backends.get(connection.vendor, FallbackSearchBackend)(connection)
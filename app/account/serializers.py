@@ -1,9 +1,55 @@
+import copy
+import json
+from collections import OrderedDict
+
+from django.utils.translation import ugettext as _
 from rest_framework import serializers
+from rest_framework_jwt.serializers import JSONWebTokenSerializer
+from rest_framework_jwt.settings import api_settings
+
+from app.account import hashing, tree
+from app.account.models import RealUser, Department, AuditLog
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+
+class CachedFieldsMixin(object):
+    """
+    字段定义每个序列化器类只生成一次，之后每个实例复制缓存的字段
+    字段及Meta不在运行时修改，不同角色使用不同的序列化器类
+    fields参数只返回指定的字段（?fields= / ?omit=），只复制选中的字段
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.selected_fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
 
-from app.account.models import RealUser, Department
+    def get_fields(self):
+        cls = type(self)
+        # 仅读取本类的缓存，避免子类使用父类字段
+        fields = cls.__dict__.get('_cached_fields')
+        if fields is None:
+            fields = super().get_fields()
+            cls._cached_fields = fields
+
+        ret = OrderedDict()
+        for name, field in fields.items():
+            if self.selected_fields is not None and name not in self.selected_fields:
+                continue
+            # 子字段绑定了父字段，需要完整复制；其他字段创建后只读，浅复制即可
+            if isinstance(field, serializers.BaseSerializer) or hasattr(field, 'child') or \
+                    hasattr(field, 'child_relation'):
+                new_field = copy.deepcopy(field)
+            else:
+                new_field = copy.copy(field)
+            # UniqueValidator等会记录当前实例，需要每个字段独立
+            new_field.validators = [copy.copy(validator) for validator in field.validators]
+            ret[name] = new_field
+        return ret
 
 
-class RealUserIdListSerializer(serializers.ModelSerializer):
+class RealUserIdListSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
     账户id列表
     """
@@ -18,9 +64,25 @@ class RealUserIdListSerializer(serializers.ModelSerializer):
         read_only = True
 
 
-class RealUserDetailSerializer(serializers.ModelSerializer):
+class RealUserSearchSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
-    获取账户信息
+    账户搜索结果
+    """
+    detail_url = serializers.HyperlinkedIdentityField(
+        view_name='user-detail',
+        lookup_field='pk'
+    )
+
+    class Meta:
+        model = RealUser
+        fields = ('id', 'username', 'first_name', 'last_name', 'phone_number', 'id_number', 'department',
+                  'is_active', 'detail_url')
+        read_only = True
+
+
+class RealUserDetailSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    获取账户信息（管理员）
     """
 
     class Meta:
@@ -28,7 +90,17 @@ class RealUserDetailSerializer(serializers.ModelSerializer):
         exclude = ('password', 'jwt_deadline')
 
 
-class RealUserCreateSerializer(serializers.ModelSerializer):
+class RealUserLimitedDetailSerializer(RealUserDetailSerializer):
+    """
+    获取账户信息（非管理员），删除部分字段，设置只读字段
+    """
+
+    class Meta(RealUserDetailSerializer.Meta):
+        exclude = ('password', 'is_superuser', 'is_staff', 'jwt_deadline')
+        read_only_fields = ('is_active',)
+
+
+class RealUserCreateSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
     注册账户
     """
@@ -46,7 +118,7 @@ class RealUserCreateSerializer(serializers.ModelSerializer):
         return ret
 
 
-class RealUserChangePasswordSerializer(serializers.ModelSerializer):
+class RealUserChangePasswordSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
     更改密码
     """
@@ -65,16 +137,127 @@ class RealUserChangePasswordSerializer(serializers.ModelSerializer):
         return ret
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """
     部门信息
     """
 
     def validate(self, data):
-        if data.get('director', None) and data['director'] not in [i for i in self.instance.department_name.all()]:
+        # 主管已由主键字段查询，直接比较所属部门，不再加载部门全部成员
+        director = data.get('director', None)
+        if director and (self.instance is None or director.department_id != self.instance.pk):
             raise serializers.ValidationError('部门主管必须属于该部门')
+        parent = data.get('parent', None)
+        if parent and self.instance is not None and tree.is_descendant(parent.pk, self.instance.pk):
+            raise serializers.ValidationError({'parent': ['上级部门不能是本部门或下级部门']})
         return data
 
     class Meta:
         model = Department
         fields = '__all__'
+
+
+class DepartmentMemberSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    部门成员简要信息
+    """
+
+    class Meta:
+        model = RealUser
+        fields = ('id', 'username', 'first_name', 'last_name')
+        read_only_fields = fields
+
+
+class DepartmentSummarySerializer(DepartmentSerializer):
+    """
+    部门信息，包含成员数及主管信息
+    member_count 由查询annotate，主管由select_related加载
+    """
+    member_count = serializers.IntegerField(read_only=True)
+    director_username = serializers.CharField(source='director.username', read_only=True, default=None)
+    director_name = serializers.CharField(source='director.get_full_name', read_only=True, default=None)
+
+    class Meta(DepartmentSerializer.Meta):
+        fields = ('id', 'name', 'director', 'member_count', 'director_username', 'director_name')
+
+
+class DepartmentSummaryMembersSerializer(DepartmentSummarySerializer):
+    """
+    部门信息，包含成员数、主管信息及前N个成员
+    """
+    members = DepartmentMemberSerializer(many=True, read_only=True)
+
+    class Meta(DepartmentSummarySerializer.Meta):
+        fields = DepartmentSummarySerializer.Meta.fields + ('members',)
+
+
+class DepartmentSubtreeMemberSerializer(DepartmentMemberSerializer):
+    """
+    部门及下级部门成员简要信息，包含所属部门
+    """
+
+    class Meta(DepartmentMemberSerializer.Meta):
+        fields = DepartmentMemberSerializer.Meta.fields + ('department',)
+        read_only_fields = fields
+
+
+class DepartmentAncestorSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    上级部门及主管信息
+    depth 为与查询部门的层级差，由查询annotate，主管由select_related加载
+    """
+    depth = serializers.IntegerField(read_only=True)
+    director_username = serializers.CharField(source='director.username', read_only=True, default=None)
+    director_name = serializers.CharField(source='director.get_full_name', read_only=True, default=None)
+
+    class Meta:
+        model = Department
+        fields = ('id', 'name', 'parent', 'depth', 'director', 'director_username', 'director_name')
+        read_only_fields = fields
+
+
+class DepartmentCreateSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    添加部门
+    """
+
+    class Meta:
+        model = Department
+        fields = ('name', 'parent')
+
+
+class AuditLogSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    """
+    审计日志
+    """
+    changes = serializers.SerializerMethodField()
+
+    def get_changes(self, obj):
+        return json.loads(obj.changes)
+
+    class Meta:
+        model = AuditLog
+        fields = '__all__'
+
+
+class PooledJSONWebTokenSerializer(JSONWebTokenSerializer):
+    """
+    登录获取token，密码校验交由哈希线程池执行
+    """
+
+    def validate(self, attrs):
+        username = attrs.get(self.username_field)
+        password = attrs.get('password')
+        if not (username and password):
+            return super().validate(attrs)
+
+        user = hashing.authenticate(username, password)
+        if not user:
+            msg = _('Unable to log in with provided credentials.')
+            raise serializers.ValidationError(msg)
+
+        payload = jwt_payload_handler(user)
+        return {
+            'token': jwt_encode_handler(payload),
+            'user': user
+        }
@@ -0,0 +1,122 @@
+from django.db import connections
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from app.account import routers, tree
+from app.account.cache import principal_cache, response_cache, user_generation
+from app.account.models import RealUser, Department
+from app.account.search import get_backend
+
+
+@receiver(post_save, sender=RealUser)
+@receiver(post_delete, sender=RealUser)
+def invalidate_principal_cache(sender, instance, **kwargs):
+    """
+    账户修改（更新资料、更改密码、删除）后清除认证缓存
+    """
+    principal_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=RealUser)
+@receiver(post_delete, sender=RealUser)
+def invalidate_user_response_cache(sender, instance, **kwargs):
+    """
+    账户修改后清除账户详情及部门汇总的响应缓存
+    """
+    response_cache.invalidate(user_generation(instance.pk), 'users')
+
+
+@receiver(post_save, sender=RealUser)
+@receiver(post_delete, sender=RealUser)
+def stick_user_to_primary(sender, instance, **kwargs):
+    """
+    账户修改后，该账户的请求在粘滞时间内从主库读取，避免认证时读取到副本中旧的jwt_deadline
+    """
+    routers.stick(instance.pk)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_department_response_cache(sender, instance, **kwargs):
+    """
+    部门修改后清除部门列表及详情的响应缓存
+    """
+    response_cache.invalidate('department')
+
+
+@receiver(pre_save, sender=Department)
+def check_department_parent(sender, instance, raw, using, update_fields, **kwargs):
+    """
+    修改上级部门前检查不能是本部门或下级部门
+    未从数据库加载上级部门（手动构造的对象）时查询修改前的上级部门
+    """
+    if raw or instance.pk is None or 'parent_id' in instance.get_deferred_fields() or \
+            (update_fields is not None and 'parent' not in update_fields):
+        return
+    if not hasattr(instance, '_loaded_parent_id'):
+        instance._loaded_parent_id = sender.objects.using(using).filter(pk=instance.pk) \
+            .values_list('parent_id', flat=True).first()
+    if instance.parent_id is not None and instance.parent_id != instance._loaded_parent_id and \
+            tree.is_descendant(instance.parent_id, instance.pk, using):
+        raise tree.TreeError('上级部门不能是本部门或下级部门')
+
+
+@receiver(post_save, sender=Department)
+def maintain_department_tree(sender, instance, created, raw, using, update_fields, **kwargs):
+    """
+    添加部门时写入闭包表，修改上级部门时移动子树
+    """
+    if created:
+        tree.insert_node(instance, using)
+    elif hasattr(instance, '_loaded_parent_id') and instance._loaded_parent_id != instance.parent_id and \
+            (update_fields is None or 'parent' in update_fields):
+        # 已在保存前检查
+        tree.move_node(instance, instance.parent_id, validate=False, using=using)
+    if 'parent_id' not in instance.get_deferred_fields():
+        instance._loaded_parent_id = instance.parent_id
+
+
+@receiver(pre_delete, sender=Department)
+def detach_department_children(sender, instance, using, **kwargs):
+    """
+    删除部门前将下级部门移至其上级部门
+    """
+    tree.remove_node(instance, using)
+
+
+@receiver(m2m_changed, sender=RealUser.groups.through)
+@receiver(m2m_changed, sender=RealUser.user_permissions.through)
+def touch_user_on_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    账户分组、权限变化时更新账户update_time，保证ETag变化，同时清除认证缓存及响应缓存
+    """
+    field_name = 'groups' if sender is RealUser.groups.through else 'user_permissions'
+    if not reverse:
+        if action not in ['post_add', 'post_remove', 'post_clear']:
+            return
+        users = RealUser.objects.filter(pk=instance.pk)
+    # 从分组、权限一侧修改，清空前查询关联账户
+    elif action in ['post_add', 'post_remove'] and pk_set:
+        users = RealUser.objects.filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        users = RealUser.objects.filter(**{field_name: instance})
+    else:
+        return
+
+    pks = list(users.values_list('pk', flat=True))
+    RealUser.objects.filter(pk__in=pks).update(update_time=timezone.now())
+    for pk in pks:
+        principal_cache.invalidate(pk)
+    # 展开主管的部门数据包含分组、权限
+    response_cache.invalidate('users', *[user_generation(pk) for pk in pks])
+    routers.stick(*pks)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    """
+    迁移后创建账户搜索索引（SQLite FTS5 / MySQL FULLTEXT），已存在时不处理
+    """
+    if sender.label == 'account':
+        get_backend(connections[using]).install()
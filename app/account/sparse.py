@@ -0,0 +1,108 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+_readable_fields = {}
+
+
+def readable_fields(serializer_class):
+    """
+    序列化器可返回的字段名，按序列化器顺序，每个序列化器类只计算一次
+    """
+    fields = _readable_fields.get(serializer_class)
+    if fields is None:
+        fields = _readable_fields[serializer_class] = tuple(
+            name for name, field in serializer_class().fields.items() if not field.write_only)
+    return fields
+
+
+def parse_field_names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def select_fields(available, fields=None, omit=None):
+    """
+    按 fields（只返回）及 omit（不返回）参数选择字段，顺序与序列化器一致
+    :param available: 可返回的字段名
+    :return: 字段名元组，两个参数都为空时返回None
+    """
+    requested = parse_field_names(fields)
+    omitted = parse_field_names(omit)
+    if not requested and not omitted:
+        return None
+    errors = {}
+    for param, names in [('fields', requested), ('omit', omitted)]:
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            errors[param] = ['不支持的字段: %s' % ','.join(unknown)]
+    if errors:
+        raise ValidationError(errors)
+    return tuple(name for name in available if (not requested or name in requested) and name not in omitted)
+
+
+def model_columns(serializer_class, fields, model, extra_fields=()):
+    """
+    选中的序列化器字段 -> .only() 的模型字段
+    字段来源为关联对象或方法时返回None，不限制查询的列
+    :param extra_fields: 不对应数据库列的字段（注解、附加属性）
+    """
+    columns = ['pk']
+    for name, field in serializer_class(fields=fields).fields.items():
+        if name in extra_fields:
+            continue
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            columns.append(field.lookup_field)
+            continue
+        if field.source == '*' or '.' in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        # 多对多字段由序列化器另外查询
+        if model_field.concrete and not model_field.many_to_many:
+            columns.append(model_field.name)
+    return columns
+
+
+class SparseFieldsMixin(object):
+    """
+    GET请求参数 fields=a,b 只返回指定字段，omit=c 不返回指定字段
+    可选字段为当前角色序列化器的字段（管理员及普通用户排除的字段仍然排除），不支持的字段返回400
+    同时只查询需要的列：通用序列化使用 .only()，快速序列化计划只 .values() 选中的列
+    """
+    # 不对应数据库列的字段（注解、附加属性）
+    sparse_extra_fields = ()
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            if self.request.method in ('GET', 'HEAD'):
+                params = self.request.query_params
+                self._sparse_fields = select_fields(readable_fields(self.get_serializer_class()),
+                                                    params.get('fields'), params.get('omit'))
+        return self._sparse_fields
+
+    def field_selected(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        columns = model_columns(self.get_serializer_class(), fields, queryset.model, self.sparse_extra_fields)
+        if columns is None:
+            return queryset
+        # 条件请求使用详情对象的更新时间计算版本
+        version_field = getattr(self, 'version_field', None)
+        if version_field is not None:
+            columns.append(version_field)
+        return queryset.only(*columns)
@@ -0,0 +1,135 @@
+import datetime
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from app.account import tree
+from app.account.cache import response_cache
+from app.account.models import RealUser, Department
+
+# 学历分布权重，与HIGHEST_EDUCATION顺序一致
+EDUCATION_WEIGHTS = (
+    ('primary_school', 2),
+    ('middle_school', 6),
+    ('high_school', 12),
+    ('polytechnic_school', 10),
+    ('junior_college', 24),
+    ('undergraduate', 33),
+    ('master', 11),
+    ('doctor', 2),
+)
+# 性别分布权重
+SEX_WEIGHTS = (('man', 52), ('woman', 48))
+# 已离职比例
+LEAVE_RATE = 0.12
+# 入职日期最早为多少年前
+ENTRY_YEARS = 15
+# 默认的入职、离职日期截止日期，固定日期保证不同日期生成的数据一致
+REFERENCE_DATE = datetime.date(2020, 1, 1)
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈'
+GIVEN_NAMES = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超兰霞平刚桂华建国志文斌辉宇浩然欣怡子轩梓涵雨婷俊杰晨阳'
+
+
+def _weighted(rng, weights):
+    """
+    返回按权重抽样的函数
+    """
+    values = [value for value, _ in weights]
+    cum_weights = list(accumulate(weight for _, weight in weights))
+    return lambda: rng.choices(values, cum_weights=cum_weights)[0]
+
+
+def _department_weights(count):
+    # 部门人数不均匀，少数大部门、多数小部门
+    return list(accumulate(1 / (i + 1) ** 0.8 for i in range(count)))
+
+
+def generate_dataset(users, departments=0, seed=0, password='123aaa123', chunk_size=5000, prefix='user',
+                     start=0, today=None, stdout=None):
+    """
+    生成模拟组织数据
+    相同参数及种子生成的数据一致；密码只哈希一次，所有账户共用；按分块在事务中bulk_create写入
+    :param users: 生成的账户数
+    :param departments: 生成的部门数，账户分配到全部已有部门
+    :param seed: 随机数种子
+    :param password: 账户密码
+    :param chunk_size: 每次写入数据库的行数
+    :param prefix: 用户名及部门名称前缀
+    :param start: 用户名、部门名称编号起始值，追加数据时避免重复
+    :param today: 入职、离职日期的截止日期，默认为REFERENCE_DATE
+    :param stdout: 输出进度
+    :return: {'users': 账户数, 'departments': 部门数, 'directors': 设置主管的部门数}
+    """
+    rng = random.Random(seed)
+    today = today or REFERENCE_DATE
+    encoded = make_password(password)
+
+    # bulk_create不返回主键，新部门的主键大于写入前的最大主键
+    last_pk = Department.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    with transaction.atomic():
+        Department.objects.bulk_create(
+            [Department(name='%s-department-%06d' % (prefix, start + i)) for i in range(departments)])
+    department_ids = list(Department.objects.order_by('pk').values_list('pk', flat=True))
+    new_department_ids = {pk for pk in department_ids if pk > last_pk}
+    # bulk_create不触发信号，新部门没有上级部门
+    tree.insert_roots(sorted(new_department_ids))
+
+    sex = _weighted(rng, SEX_WEIGHTS)
+    education = _weighted(rng, EDUCATION_WEIGHTS)
+    department_weights = _department_weights(len(department_ids))
+    max_days = ENTRY_YEARS * 365
+
+    # 每个新部门随机选择一名在职成员作为主管（蓄水池抽样）
+    directors = {}
+    member_counts = {}
+    created = 0
+    while created < users:
+        rows = []
+        for i in range(start + created, start + min(created + chunk_size, users)):
+            entry_date = today - datetime.timedelta(days=rng.randint(0, max_days))
+            leave_date = None
+            if rng.random() < LEAVE_RATE:
+                leave_date = entry_date + datetime.timedelta(days=rng.randint(0, (today - entry_date).days))
+            department_id = rng.choices(department_ids, cum_weights=department_weights)[0] \
+                if department_ids else None
+            username = '%s%07d' % (prefix, i)
+            if department_id in new_department_ids and leave_date is None:
+                member_counts[department_id] = member_counts.get(department_id, 0) + 1
+                if rng.random() * member_counts[department_id] < 1:
+                    directors[department_id] = username
+            rows.append(RealUser(
+                username=username,
+                password=encoded,
+                last_name=rng.choice(SURNAMES),
+                first_name=''.join(rng.choice(GIVEN_NAMES) for _ in range(rng.randint(1, 2))),
+                email='%s@example.com' % username,
+                is_active=leave_date is None,
+                sex=sex(),
+                phone_number='1%s%09d' % (rng.choice('3456789'), rng.randint(0, 999999999)),
+                highest_education=education(),
+                department_id=department_id,
+                entry_date=entry_date,
+                leave_date=leave_date,
+            ))
+        with transaction.atomic():
+            RealUser.objects.bulk_create(rows)
+        created += len(rows)
+        if stdout is not None:
+            stdout.write('%s / %s' % (created, users))
+
+    # bulk_create不返回主键，按用户名查询主管id，sqlite参数数量有限分批查询
+    usernames = list(directors.values())
+    user_ids = {}
+    for offset in range(0, len(usernames), 500):
+        user_ids.update(RealUser.objects.filter(username__in=usernames[offset:offset + 500])
+                        .values_list('username', 'pk'))
+    updated = [Department(pk=pk, director_id=user_ids[username]) for pk, username in directors.items()]
+    with transaction.atomic():
+        Department.objects.bulk_update(updated, ['director'])
+
+    # bulk_create、bulk_update不会触发信号
+    response_cache.invalidate('users', 'department')
+    return {'users': created, 'departments': departments, 'directors': len(updated)}
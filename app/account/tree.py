@@ -0,0 +1,178 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from app.account.models import Department, DepartmentClosure, RealUser
+
+
+class TreeError(ValueError):
+    """
+    上级部门为本部门或其下级部门
+    """
+
+
+def _using(using=None, department=None):
+    return using or (department is not None and department._state.db) or router.db_for_write(DepartmentClosure)
+
+
+def _execute(sql, params, using):
+    connection = connections[using]
+    table = connection.ops.quote_name(DepartmentClosure._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(table=table), params)
+        return cursor.rowcount
+
+
+def _external_paths(include_self):
+    """
+    子树与该部门全部上级部门之间的路径，参数为 [pk, pk, pk]
+    同一个表的子查询包在派生表中，MySQL不允许UPDATE/DELETE直接引用被修改的表
+    :param include_self: 子树是否包括该部门
+    """
+    return ('descendant_id IN (SELECT descendant_id FROM (SELECT descendant_id FROM {table} WHERE ancestor_id = %s'
+            + ('' if include_self else ' AND descendant_id <> ancestor_id') + ') sub) '
+            'AND ancestor_id IN (SELECT ancestor_id FROM '
+            '(SELECT ancestor_id FROM {table} WHERE descendant_id = %s AND ancestor_id <> %s) anc)')
+
+
+def insert_roots(pks, using=None):
+    """
+    没有上级部门的新部门（bulk_create等不触发信号时使用）
+    """
+    DepartmentClosure.objects.using(_using(using)).bulk_create(
+        [DepartmentClosure(ancestor_id=pk, descendant_id=pk, depth=0) for pk in pks], batch_size=1000)
+
+
+def insert_node(department, using=None):
+    """
+    新部门：自身及上级部门的全部上级部门，一次查询
+    上级部门没有闭包表记录（添加闭包表之前已存在的部门）时按parent重建
+    """
+    using = _using(using, department)
+    inserted = _execute('INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                        'SELECT ancestor_id, %s, depth + 1 FROM {table} WHERE descendant_id = %s '
+                        'UNION ALL SELECT %s, %s, 0',
+                        [department.pk, department.parent_id, department.pk, department.pk], using)
+    if department.parent_id is not None and inserted < 2:
+        rebuild(using)
+
+
+def is_descendant(pk, ancestor_pk, using=None):
+    """
+    pk是否为ancestor_pk或其下级部门
+    """
+    return DepartmentClosure.objects.using(_using(using)).filter(ancestor_id=ancestor_pk, descendant_id=pk).exists()
+
+
+def move_node(department, parent_id, validate=True, using=None):
+    """
+    移动部门及其全部下级部门：删除子树与原上级部门的路径，再连接新上级部门的全部上级部门
+    查询数与树的深度、子树大小无关；本部门或上级部门没有闭包表记录时按parent重建
+    :param validate: 是否检查新上级部门不是本部门或下级部门
+    """
+    pk = department.pk
+    using = _using(using, department)
+    if validate and parent_id is not None and is_descendant(parent_id, pk, using):
+        raise TreeError('上级部门不能是本部门或下级部门')
+    with transaction.atomic(using=using):
+        _execute('DELETE FROM {table} WHERE ' + _external_paths(True), [pk, pk, pk], using)
+        if parent_id is None:
+            if not is_descendant(pk, pk, using):
+                rebuild(using)
+        elif not _execute('INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                          'SELECT a.ancestor_id, s.descendant_id, a.depth + s.depth + 1 '
+                          'FROM {table} a CROSS JOIN {table} s WHERE a.descendant_id = %s AND s.ancestor_id = %s',
+                          [parent_id, pk], using):
+            # 自身的路径在两侧都存在时至少写入一行
+            rebuild(using)
+
+
+def remove_node(department, using=None):
+    """
+    删除部门前将下级部门移至其上级部门，经过该部门的路径层级差减1
+    该部门自身的路径由外键级联删除
+    """
+    pk = department.pk
+    using = _using(using, department)
+    _execute('UPDATE {table} SET depth = depth - 1 WHERE ' + _external_paths(False), [pk, pk, pk], using)
+    Department.objects.using(using).filter(parent_id=pk) \
+        .update(parent_id=department.parent_id, update_time=timezone.now())
+
+
+def rebuild(using=None):
+    """
+    按parent重新生成闭包表（导入数据、直接update上级部门后使用）
+    :return: 写入的行数
+    """
+    using = _using(using)
+    parents = dict(Department.objects.using(using).values_list('pk', 'parent_id'))
+    chains = {}
+
+    def chain(pk):
+        # 自身及全部上级部门，从近到远
+        if pk not in chains:
+            path, node = [], pk
+            while node is not None and node not in chains:
+                if node in path:
+                    raise TreeError('部门 %s 的上级部门存在循环' % node)
+                path.append(node)
+                node = parents.get(node)
+            tail = chains[node] if node is not None else []
+            for i, item in enumerate(path):
+                chains[item] = path[i:] + tail
+        return chains[pk]
+
+    rows = [DepartmentClosure(ancestor_id=ancestor, descendant_id=pk, depth=depth)
+            for pk in parents for depth, ancestor in enumerate(chain(pk))]
+    with transaction.atomic(using=using):
+        DepartmentClosure.objects.using(using).all().delete()
+        DepartmentClosure.objects.using(using).bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def missing_nodes(using=None):
+    """
+    没有自身闭包表记录的部门（添加闭包表之前已存在、bulk_create后未写入等）
+    """
+    using = _using(using)
+    nodes = DepartmentClosure.objects.using(using).filter(ancestor_id=F('descendant_id')).values('descendant_id')
+    return Department.objects.using(using).exclude(pk__in=nodes)
+
+
+def subtree_members(pk, max_depth=None):
+    """
+    部门及其下级部门的全部成员，一次查询
+    :param max_depth: 最多包含的下级层数，None为全部
+    """
+    links = DepartmentClosure.objects.filter(ancestor_id=pk)
+    if max_depth is not None:
+        links = links.filter(depth__lte=max_depth)
+    return RealUser.objects.filter(department__in=links.values('descendant_id'))
+
+
+def ancestors(pk):
+    """
+    全部上级部门，从近到远，depth为层级差，一次查询
+    """
+    return Department.objects.filter(descendant_links__descendant_id=pk, descendant_links__depth__gt=0) \
+        .annotate(depth=F('descendant_links__depth')) \
+        .select_related('director') \
+        .order_by('depth')
+
+
+def managers(pk):
+    """
+    部门及其全部上级部门的主管，从近到远，depth为层级差（本部门为0），一次查询
+    """
+    return Department.objects.filter(descendant_links__descendant_id=pk, director__isnull=False) \
+        .annotate(depth=F('descendant_links__depth')) \
+        .select_related('director') \
+        .order_by('depth')
+
+
+def headcount(pk):
+    """
+    部门及其下级部门的成员数及部门数，一次查询
+    """
+    return DepartmentClosure.objects.filter(ancestor_id=pk).aggregate(
+        departments=Count('descendant_id', distinct=True), headcount=Count('descendant__department_name'))
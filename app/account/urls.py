@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 from rest_framework_jwt.views import obtain_jwt_token, refresh_jwt_token, verify_jwt_token
@@ -14,10 +15,22 @@ urlpatterns = [
     path('id-list/', views.RealUserIdList.as_view(), name='user-id-list'),
     # 获取id1至id2之间的全部账户信息
     path('some-user-detail/', views.RealUserSomeUserDetailIList.as_view(), name='some-user-detail'),
+    # 搜索账户
+    path('user-search/', views.RealUserSearch.as_view(), name='user-search'),
+    # 流式导出账户、部门
+    path('user-export/', views.RealUserExport.as_view(), name='user-export'),
+    path('department-export/', views.DepartmentExport.as_view(), name='department-export'),
+    # 批量导入账户
+    path('user-import/', views.RealUserImport.as_view(), name='user-import'),
+    # 审计日志
+    path('audit-log/', views.AuditLogList.as_view(), name='audit-log'),
 
     # jwt
-    # 登录获取token
-    path('login/', obtain_jwt_token, name='login'),
+    # 登录获取token，开启哈希线程池时使用限流登录
+    path('login/',
+         views.PooledObtainJSONWebToken.as_view()
+         if getattr(settings, 'LOGIN_HASH_POOL', {}).get('ENABLED', False) else obtain_jwt_token,
+         name='login'),
     # 刷新token
     path('token-refresh/', refresh_jwt_token, name='refresh-token'),
     # 验证token
@@ -1,20 +1,49 @@
 import datetime
 from calendar import timegm
 
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.db.models import Q, Count, F, OuterRef, Subquery
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics, mixins, viewsets, status
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_jwt.views import ObtainJSONWebToken
 
-from app.account.models import RealUser, Department
-from app.account.serializers import RealUserIdListSerializer, RealUserDetailSerializer, RealUserCreateSerializer, \
-    RealUserChangePasswordSerializer, DepartmentSerializer
+from app.account.audit import audit_log, snapshot, query as query_audit_log
+from app.account import tree
+from app.account.batch import BatchSerializer, execute_batch, read_body, MAX_BODY_SIZE
+from app.account.cache import ResponseCacheMixin, principal_cache, response_cache, user_generation
+from app.account.compiled import CompiledListMixin, get_plan
+from app.account.conditional import ConditionalGetMixin, collection_version
+from app.account.expand import ExpandMixin
+from app.account.export import export_fields, iter_rows, ndjson_stream, csv_stream
+from app.account.hashing import PoolSaturated
+from app.account.importer import import_users, get_thread_executor
+from app.account.metrics import request_metrics, render_prometheus
+from app.account.models import RealUser, Department, AUDIT_TARGET_TYPES
+from app.account.renderers import NDJSONRenderer, CSVRenderer, PrometheusRenderer
+from app.account.search import split_terms, encode_cursor, decode_cursor, get_backend
+from app.account.sparse import SparseFieldsMixin, select_fields
+from app.account.serializers import RealUserIdListSerializer, RealUserDetailSerializer, \
+    RealUserLimitedDetailSerializer, RealUserSearchSerializer, RealUserCreateSerializer, \
+    RealUserChangePasswordSerializer, DepartmentSerializer, DepartmentCreateSerializer, DepartmentSummarySerializer, \
+    DepartmentSummaryMembersSerializer, DepartmentSubtreeMemberSerializer, DepartmentAncestorSerializer, \
+    PooledJSONWebTokenSerializer, AuditLogSerializer
 
 
-class RealUserViewSets(mixins.RetrieveModelMixin,
+class RealUserViewSets(ExpandMixin,
+                       ResponseCacheMixin,
+                       ConditionalGetMixin,
+                       SparseFieldsMixin,
+                       mixins.RetrieveModelMixin,
                        mixins.CreateModelMixin,
                        mixins.UpdateModelMixin,
                        mixins.DestroyModelMixin,
@@ -29,7 +58,8 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
         if self.action in ['list',
                            'retrieve',
                            'update',
-                           'change_password']:
+                           'change_password',
+                           'managers']:
             permission_classes = [IsAuthenticated]
         elif self.action in ['create']:
             permission_classes = [AllowAny]
@@ -37,25 +67,22 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
-    def get_serializer(self, *args, **kwargs):
-        serializer_class = self.get_serializer_class()
-
-        # 非管理员，删除部分字段，设置只读字段
-        if self.action not in ['create', 'change-password']:
-            if not self.request.user or not self.request.user.is_superuser:
-                serializer_class.Meta.exclude = ('password', 'is_superuser', 'is_staff', 'jwt_deadline')
-                serializer_class.Meta.read_only_fields = ('is_active',)
-
-        kwargs['context'] = self.get_serializer_context()
-        return serializer_class(*args, **kwargs)
+    def get_cache_generations(self, request, *args, **kwargs):
+        try:
+            return [user_generation(int(kwargs['pk']))] + self.get_expand_generations()
+        except (KeyError, ValueError):
+            return None
 
     def get_serializer_class(self):
         if self.action in ['create']:
             serializer_class = RealUserCreateSerializer
         elif self.action in ['change_password']:
             serializer_class = RealUserChangePasswordSerializer
-        else:
+        elif self.request.user and self.request.user.is_superuser:
             serializer_class = RealUserDetailSerializer
+        else:
+            # 非管理员，删除部分字段，设置只读字段
+            serializer_class = RealUserLimitedDetailSerializer
         return serializer_class
 
     def update(self, request, *args, **kwargs):
@@ -77,13 +104,22 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
         return Response(serializer.data)
 
     def perform_create(self, serializer):
-        instance = serializer.save()
-        instance.set_password(instance.password)
-        instance.save()
+        # 保存前哈希密码，只写入一次数据库
+        serializer.save(password=make_password(serializer.validated_data['password']))
+
+    def perform_update(self, serializer):
+        # 修改前的字段值已加载，只在修改分组、权限时查询
+        m2m_fields = [name for name in ['groups', 'user_permissions'] if name in serializer.validated_data]
+        before = snapshot(serializer.instance, m2m_fields)
+        super().perform_update(serializer)
+        audit_log.record(self.request.user, 'update', serializer.instance, before,
+                         snapshot(serializer.instance, m2m_fields))
 
     def perform_destroy(self, instance):
+        before = snapshot(instance)
         instance.is_active = False
         instance.save()
+        audit_log.record(self.request.user, 'deactivate', instance, before, snapshot(instance))
 
     @action(
         methods=['POST'],
@@ -103,6 +139,7 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
         if request.user.is_superuser or request.user.pk == int(pk):
             serializer = RealUserChangePasswordSerializer(data=request.data)
             if serializer.is_valid():
+                before = snapshot(user)
                 user.set_password(request.data['password'])
                 # 设置过期时间修改后3秒
                 user.jwt_deadline = timegm(
@@ -111,6 +148,7 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
                      ).utctimetuple()
                 )
                 user.save()
+                audit_log.record(request.user, 'change_password', user, before, snapshot(user))
                 return Response({'status': 'password set, please login after 3 seconds'})
             else:
                 return Response(serializer.errors,
@@ -118,6 +156,16 @@ class RealUserViewSets(mixins.RetrieveModelMixin,
         else:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
+    @action(methods=['GET'], detail=True)
+    def managers(self, request, pk=None):
+        """
+        所属部门及全部上级部门的主管，从近到远
+        """
+        user = self.get_object()
+        if user.department_id is None:
+            return Response([])
+        return Response(DepartmentAncestorSerializer(tree.managers(user.department_id), many=True).data)
+
 
 # 通用分页设置
 class CurrencyResultsSetPagination(PageNumberPagination):
@@ -129,8 +177,40 @@ class CurrencyResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
 
 
+# 游标分页设置
+class CurrencyCursorPagination(CursorPagination):
+    """
+    按id游标分页，每页10条，最大10000条
+    不查询总数，翻页按 id > 游标 查询，任意深度翻页耗时相同
+    """
+    page_size = 10
+    max_page_size = 10000
+    page_size_query_param = 'page_size'
+    ordering = 'id'
+
+
+class CursorPaginationMixin(object):
+    """
+    请求参数 pagination=cursor 时使用游标分页，否则使用页码分页
+    """
+    cursor_pagination_class = CurrencyCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+
 # 获取账户ID列表
-class RealUserIdList(mixins.ListModelMixin,
+class RealUserIdList(ConditionalGetMixin,
+                     SparseFieldsMixin,
+                     CursorPaginationMixin,
+                     CompiledListMixin,
+                     mixins.ListModelMixin,
                      generics.GenericAPIView):
     """
     获取账户ID列表
@@ -144,8 +224,52 @@ class RealUserIdList(mixins.ListModelMixin,
         return self.list(request, *args, **kwargs)
 
 
+def filter_id_range(queryset, query_params):
+    """
+    按请求参数id1、id2筛选id范围，id1与id2大小顺序不限
+    参数不是整数时抛出ValidationError
+    :param queryset:
+    :param query_params:
+    :return:
+    """
+    id1 = query_params.get('id1', None)
+    id2 = query_params.get('id2', None)
+    # 无参数
+    if id1 is None and id2 is None:
+        return queryset
+    # 单参数
+    if id1 is None:
+        id1 = 0
+    if id2 is None:
+        id2 = 0
+
+    errors = {}
+    try:
+        id1 = int(id1)
+    except ValueError:
+        errors['id1'] = ['请填写合法的整数值。']
+    try:
+        id2 = int(id2)
+    except ValueError:
+        errors['id2'] = ['请填写合法的整数值。']
+    if errors:
+        raise ValidationError(errors)
+    if id1 == id2:
+        queryset = queryset.filter(pk=id1)
+    elif id1 > id2:
+        queryset = queryset.filter(Q(pk__gte=id2) & Q(pk__lte=id1))
+    else:
+        queryset = queryset.filter(Q(pk__gte=id1) & Q(pk__lte=id2))
+    return queryset
+
+
 # 获取id1到id2之间的全部账户信息
-class RealUserSomeUserDetailIList(mixins.ListModelMixin,
+class RealUserSomeUserDetailIList(ExpandMixin,
+                                  ConditionalGetMixin,
+                                  SparseFieldsMixin,
+                                  CursorPaginationMixin,
+                                  CompiledListMixin,
+                                  mixins.ListModelMixin,
                                   generics.GenericAPIView):
     """
     获取id1到id2之间的全部账户信息
@@ -155,64 +279,451 @@ class RealUserSomeUserDetailIList(mixins.ListModelMixin,
     permission_classes = (IsAdminUser,)
 
     def get_queryset(self):
-        queryset = RealUser.objects
-        id1 = self.request.query_params.get('id1', None)
-        id2 = self.request.query_params.get('id2', None)
-        # 无参数
-        if id1 is None and id2 is None:
-            return queryset.all().order_by('id')
-        # 单参数
-        if id1 is None:
-            id1 = 0
-        if id2 is None:
-            id2 = 0
-
-        if id1 is not None and id2 is not None:
-            id1 = int(id1)
-            id2 = int(id2)
-            if id1 == id2:
-                queryset = queryset.filter(pk=id1)
-            elif id1 > id2:
-                queryset = queryset.filter(Q(pk__gte=id2) & Q(pk__lte=id1))
-            else:
-                queryset = queryset.filter(Q(pk__gte=id1) & Q(pk__lte=id2))
-        else:
-            queryset = queryset.all()
-        return queryset.order_by('id')
+        return filter_id_range(RealUser.objects.all(), self.request.query_params).order_by('id')
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class DepartmentViewSets(viewsets.ModelViewSet):
+# 搜索账户
+class RealUserSearch(ExpandMixin, SparseFieldsMixin, generics.GenericAPIView):
+    """
+    按用户名、姓名、手机号、身份证号前缀搜索账户，按相关度排序
+    department参数筛选部门，返回的next按游标翻页
+    """
+    expand_model = RealUser
+    permission_classes = (IsAdminUser,)
+    serializer_class = RealUserSearchSerializer
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request, *args, **kwargs):
+        terms = split_terms(request.query_params.get('q', ''))
+        if not terms:
+            return Response({'q': ['该字段是必填项。']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            department = request.query_params.get('department')
+            department = int(department) if department else None
+        except ValueError:
+            return Response({'department': ['请填写合法的整数值。']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = min(int(request.query_params.get('page_size', self.page_size)), self.max_page_size)
+        except ValueError:
+            return Response({'page_size': ['请填写合法的整数值。']}, status=status.HTTP_400_BAD_REQUEST)
+        if page_size < 1:
+            return Response({'page_size': ['请确保该值大于或者等于 1。']}, status=status.HTTP_400_BAD_REQUEST)
+        after = None
+        if request.query_params.get('cursor'):
+            try:
+                after = decode_cursor(request.query_params['cursor'])
+            except ValueError:
+                return Response({'cursor': ['无效的游标。']}, status=status.HTTP_400_BAD_REQUEST)
+
+        backend = get_backend(connections[router.db_for_read(RealUser)])
+        rows = backend.search(terms, department, after, page_size + 1)
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(*rows[-1]))
+
+        # 索引只返回id，一次查询获取账户并按相关度排序
+        ids = [pk for _, pk in rows]
+        plan = get_plan(self.get_serializer_class(), 'admin', self.get_sparse_fields())
+        users = {row['pk']: row for row in RealUser.objects.filter(pk__in=ids).values(*plan.columns)}
+        results = plan.render([users[pk] for pk in ids if pk in users], request)
+        return Response({'next': next_url, 'results': results})
+
+
+# 批量导入账户
+class RealUserImport(generics.GenericAPIView):
+    """
+    批量导入账户，请求体为CSV（text/csv，首行为表头）或NDJSON（application/x-ndjson）
+    部门使用部门名称，单行错误不影响其他行
+    """
+    permission_classes = (IsAdminUser,)
+    # 直接逐行读取请求体，不经过解析器
+    parser_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type in ['text/csv']:
+            fmt = 'csv'
+        elif content_type in ['application/x-ndjson', 'application/jsonlines']:
+            fmt = 'ndjson'
+        else:
+            return Response({'detail': '仅支持text/csv或application/x-ndjson'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        chunk_size = None
+        if 'chunk_size' in request.query_params:
+            try:
+                chunk_size = int(request.query_params['chunk_size'])
+            except ValueError:
+                return Response({'chunk_size': ['请填写合法的整数值。']}, status=status.HTTP_400_BAD_REQUEST)
+            if chunk_size < 1:
+                return Response({'chunk_size': ['请确保该值大于或者等于 1。']}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 请求体为空时stream为None；密码使用进程内共享的线程池哈希，不在请求中创建进程池
+        report = import_users(request.stream or [], fmt, chunk_size=chunk_size, executor=get_thread_executor())
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
+
+# 流式导出
+class ExportAPIView(generics.GenericAPIView):
+    """
+    流式导出，NDJSON（默认）或CSV（format=csv），fields参数选择字段
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    filename = 'export'
+    # 返回流式响应，批量请求中执行前拒绝
+    streaming = True
+
+    def get(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        fields = export_fields(serializer_class)
+        if request.query_params.get('fields'):
+            selected = request.query_params['fields'].split(',')
+            unknown = [name for name in selected if name not in fields]
+            if unknown:
+                return Response({'fields': ['不支持的字段: %s' % ','.join(unknown)]},
+                                status=status.HTTP_400_BAD_REQUEST)
+            fields = selected
+        if request.query_params.get('omit'):
+            fields = list(select_fields(fields, omit=request.query_params['omit']))
+
+        rows = iter_rows(self.get_queryset(), serializer_class, fields)
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            content = csv_stream(rows, fields)
+        else:
+            content = ndjson_stream(rows)
+        response = StreamingHttpResponse(content, content_type='%s; charset=utf-8' % renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (self.filename, renderer.format)
+        return response
+
+
+# 导出账户
+class RealUserExport(ExportAPIView):
+    """
+    流式导出账户，支持id1、id2范围筛选
+    """
+    serializer_class = RealUserDetailSerializer
+    filename = 'user'
+
+    def get_queryset(self):
+        return filter_id_range(RealUser.objects.all(), self.request.query_params)
+
+
+# 导出部门
+class DepartmentExport(ExportAPIView):
+    """
+    流式导出部门
+    """
+    queryset = Department.objects.all()
+    serializer_class = DepartmentSerializer
+    filename = 'department'
+
+
+class DepartmentViewSets(ExpandMixin, ResponseCacheMixin, ConditionalGetMixin, SparseFieldsMixin,
+                         viewsets.ModelViewSet):
     """
     部门视图集
     """
     queryset = Department.objects.all().order_by('id')
     pagination_class = CurrencyResultsSetPagination
+    sparse_extra_fields = ('member_count', 'members')
 
     def get_permissions(self):
         """
         普通用户只允许查看，管理员可以添加更新删除
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'members', 'ancestors', 'headcount']:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    # 嵌入成员时每个部门最多返回的成员数
+    max_members = 100
+
+    def get_summary_options(self):
+        """
+        请求参数 summary=true 时返回成员数及主管信息，members=<N> 时同时返回前N个成员
+        :return: (是否返回汇总, 成员数)
+        """
+        if not hasattr(self, '_summary_options'):
+            members = self.request.query_params.get('members', None)
+            if members is None:
+                members = 0
+            else:
+                try:
+                    members = int(members)
+                except ValueError:
+                    raise ValidationError({'members': ['请填写合法的整数值。']})
+                members = min(max(members, 0), self.max_members)
+            summary = members > 0 or self.request.query_params.get('summary', '').lower() in ['1', 'true']
+            self._summary_options = (summary, members)
+        return self._summary_options
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve'] and self.get_summary_options()[0]:
+            # 只加载选中字段需要的主管及成员数
+            if self.field_selected('director_username') or self.field_selected('director_name'):
+                queryset = queryset.select_related('director')
+            if self.field_selected('member_count'):
+                queryset = queryset.annotate(member_count=Count('department_name'))
+        return queryset
+
+    def get_version_queryset(self):
+        return Department.objects.all()
+
+    def get_summary_departments(self, request, *args, **kwargs):
+        """
+        汇总信息包含的部门 [(id, 主管id)]：详情为该部门，列表为当前页
+        """
+        queryset = self.filter_queryset(self.get_version_queryset().order_by('id')).values_list('pk', 'director_id')
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in kwargs:
+            try:
+                return list(queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}))
+            except (TypeError, ValueError):
+                return None
+        page = self.paginate_queryset(queryset)
+        return list(page if page is not None else queryset)
+
+    def get_version(self, request, *args, **kwargs):
+        version = super().get_version(request, *args, **kwargs)
+        if version is None or not self.get_summary_options()[0]:
+            return version
+        # 汇总信息包含成员及主管，只计算返回的部门的成员及主管，不统计全部账户
+        departments = self.get_summary_departments(request, *args, **kwargs)
+        if departments is None:
+            return None
+        users = RealUser.objects.filter(Q(department__in=[pk for pk, _ in departments]) |
+                                        Q(pk__in=[director for _, director in departments if director is not None]))
+        users_version, users_last_modified = collection_version(users)
+        last_modified = max([t for t in [version[1], users_last_modified] if t is not None], default=None)
+        return (version[0], users_version), last_modified
+
+    def get_cache_generations(self, request, *args, **kwargs):
+        # 汇总信息包含成员及主管，任意账户变化时失效
+        generations = ['department', 'users'] if self.get_summary_options()[0] else ['department']
+        return generations + [name for name in self.get_expand_generations() if name not in generations]
+
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
-            serializer_class = DepartmentSerializer
-            serializer_class.read_only = True
-        elif self.action in ['create']:
-            serializer_class = DepartmentSerializer
-            serializer_class.Meta.fields = ('name',)
+        if self.action in ['create']:
+            serializer_class = DepartmentCreateSerializer
+        elif self.action in ['list', 'retrieve'] and self.get_summary_options()[1]:
+            serializer_class = DepartmentSummaryMembersSerializer
+        elif self.action in ['list', 'retrieve'] and self.get_summary_options()[0]:
+            serializer_class = DepartmentSummarySerializer
         else:
             serializer_class = DepartmentSerializer
         return serializer_class
 
+    def attach_members(self, departments):
+        """
+        一次查询获取全部部门的前N个成员（按id排序）
+        """
+        count = self.get_summary_options()[1]
+        if not count or not departments or not self.field_selected('members'):
+            return
+        # 每个部门第N个成员的id，成员不足N个时为NULL
+        cutoff = RealUser.objects.filter(department=OuterRef('department')).order_by('id').values('id')[count - 1:count]
+        members = RealUser.objects.filter(department__in=[department.pk for department in departments]) \
+            .annotate(cutoff=Subquery(cutoff)) \
+            .filter(Q(cutoff__isnull=True) | Q(id__lte=F('cutoff'))) \
+            .only('id', 'username', 'first_name', 'last_name', 'department') \
+            .order_by('department', 'id')
+        grouped = {}
+        for member in members:
+            grouped.setdefault(member.department_id, []).append(member)
+        for department in departments:
+            department.members = grouped.get(department.pk, [])
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        departments = page if page is not None else list(queryset)
+        self.attach_members(departments)
+        serializer = self.get_serializer(departments, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.attach_members([instance])
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=True)
+    def members(self, request, pk=None):
+        """
+        部门及其全部下级部门的成员，按id排序分页
+        请求参数 depth=<N> 时只包含N层以内的下级部门
+        """
+        department = self.get_object()
+        depth = request.query_params.get('depth', None)
+        if depth is not None:
+            try:
+                depth = max(int(depth), 0)
+            except ValueError:
+                raise ValidationError({'depth': ['请填写合法的整数值。']})
+        queryset = tree.subtree_members(department.pk, depth) \
+            .only('id', 'username', 'first_name', 'last_name', 'department') \
+            .order_by('id')
+        page = self.paginate_queryset(queryset)
+        serializer = DepartmentSubtreeMemberSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['GET'], detail=True)
+    def ancestors(self, request, pk=None):
+        """
+        全部上级部门及主管，从近到远
+        """
+        department = self.get_object()
+        return Response(DepartmentAncestorSerializer(tree.ancestors(department.pk), many=True).data)
+
+    @action(methods=['GET'], detail=True)
+    def headcount(self, request, pk=None):
+        """
+        部门及其全部下级部门的成员数及部门数
+        """
+        department = self.get_object()
+        return Response(dict(id=department.pk, **tree.headcount(department.pk)))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        audit_log.record(self.request.user, 'create', serializer.instance, None, snapshot(serializer.instance))
+
+    def perform_update(self, serializer):
+        before = snapshot(serializer.instance)
+        super().perform_update(serializer)
+        audit_log.record(self.request.user, 'update', serializer.instance, before, snapshot(serializer.instance))
+
+    @transaction.atomic
     def perform_destroy(self, instance):
-        users = RealUser.objects.filter(department=instance.id)
-        users.update(department=None)
+        # 移出成员与删除部门在同一事务中，删除失败时一起回滚，日志在提交后写入
+        before = snapshot(instance)
+        department_id = instance.id
+        users = RealUser.objects.filter(department=department_id)
+        pks = list(users.values_list('pk', flat=True))
+        # update不会自动更新update_time，也不会触发信号
+        users.update(department=None, update_time=timezone.now())
+        for pk in pks:
+            principal_cache.invalidate(pk)
+        response_cache.invalidate('users', *[user_generation(pk) for pk in pks])
         instance.delete()
+        # 删除后instance.pk为None，按删除前的id记录
+        audit_log.record_many(self.request.user, 'delete', Department, [department_id], before)
+        audit_log.record_many(self.request.user, 'update', RealUser, pks,
+                              {'department_id': department_id}, {'department_id': None})
+
+
+# 审计日志
+class AuditLogCursorPagination(CurrencyCursorPagination):
+    """
+    按操作时间倒序游标分页
+    批量修改的日志操作时间相同，游标需要唯一的排序，同一时间按id倒序
+    """
+    ordering = ('-created_time', '-id')
+
+
+class AuditLogList(mixins.ListModelMixin, generics.GenericAPIView):
+    """
+    按操作账户、修改对象及时间范围查询审计日志
+    """
+    serializer_class = AuditLogSerializer
+    pagination_class = AuditLogCursorPagination
+    permission_classes = (IsAdminUser,)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        errors = {}
+        filters = {}
+        for name in ['actor_id', 'target_id']:
+            if params.get(name):
+                try:
+                    filters[name] = int(params[name])
+                except ValueError:
+                    errors[name] = ['请填写合法的整数值。']
+        target_type = params.get('target_type')
+        if target_type:
+            if target_type not in dict(AUDIT_TARGET_TYPES):
+                errors['target_type'] = ['不支持的对象类型: %s' % target_type]
+            filters['target_type'] = target_type
+        for name in ['since', 'until']:
+            if params.get(name):
+                try:
+                    value = parse_datetime(params[name])
+                except ValueError:
+                    value = None
+                if value is None:
+                    errors[name] = ['请填写合法的时间。']
+                    continue
+                # 与数据库中的时间一致
+                if settings.USE_TZ and timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                elif not settings.USE_TZ and timezone.is_aware(value):
+                    value = timezone.make_naive(value)
+                filters[name] = value
+        # 修改对象的索引以target_type开头
+        if 'target_id' in filters and not target_type:
+            errors['target_type'] = ['按target_id查询时必须指定target_type。']
+        if errors:
+            raise ValidationError(errors)
+        return query_audit_log(**filters)
+
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+# 请求指标
+class RequestMetricsView(generics.GenericAPIView):
+    """
+    Prometheus格式的请求指标，合并全部工作进程
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(render_prometheus(request_metrics.collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# 批量请求
+class BatchView(generics.GenericAPIView):
+    """
+    批量请求，只认证一次，子请求在进程内依次执行，不经过中间件
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        if not read_body(request, MAX_BODY_SIZE):
+            return Response({'detail': '请求体不能超过%s字节' % MAX_BODY_SIZE},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(execute_batch(request, **serializer.validated_data))
+
+
+# 登录，密码校验交由哈希线程池执行
+class PooledObtainJSONWebToken(ObtainJSONWebToken):
+    """
+    登录获取token，哈希线程池已满时直接返回503，避免占满全部工作进程
+    """
+    serializer_class = PooledJSONWebTokenSerializer
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except PoolSaturated:
+            retry_after = getattr(settings, 'LOGIN_HASH_POOL', {}).get('RETRY_AFTER', 1)
+            return Response({'detail': '登录繁忙，请稍后重试'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(retry_after)})
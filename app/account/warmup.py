@@ -0,0 +1,204 @@
+import contextlib
+import importlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 快速序列化计划的角色，与CompiledListMixin一致
+PLAN_ROLES = ('admin', 'user')
+
+
+class StartupTimer(object):
+    """
+    启动各阶段耗时（秒）
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def total(self):
+        with self._lock:
+            return sum(self.phases.values())
+
+    def format(self):
+        with self._lock:
+            phases = list(self.phases.items())
+        return ', '.join('%s=%.1fms' % (name, elapsed * 1000) for name, elapsed in phases + [
+            ('total', sum(elapsed for _, elapsed in phases))])
+
+
+# 当前进程的启动耗时
+startup_timer = StartupTimer()
+
+
+def warm_urls():
+    """
+    导入全部URL配置，编译路由正则并生成反向解析表
+    """
+    from django.urls import get_resolver, URLResolver
+
+    def walk(resolver):
+        for pattern in resolver.url_patterns:
+            pattern.pattern.regex
+            if isinstance(pattern, URLResolver):
+                walk(pattern)
+
+    resolver = get_resolver()
+    walk(resolver)
+    # 递归生成全部include的反向解析表
+    resolver.reverse_dict
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def warm_serializers():
+    """
+    生成本项目全部序列化器的字段，编译快速序列化计划
+    """
+    from rest_framework import serializers
+    from app.account import batch, serializers as account_serializers  # noqa: F401
+    from app.account.compiled import get_plan
+    from app.account.serializers import CachedFieldsMixin
+    from app.account.sparse import readable_fields
+
+    count = 0
+    for serializer_class in set(_subclasses(serializers.Serializer)):
+        if not serializer_class.__module__.startswith('app.'):
+            continue
+        serializer_class().fields
+        count += 1
+        if issubclass(serializer_class, CachedFieldsMixin) and issubclass(serializer_class,
+                                                                        serializers.ModelSerializer):
+            readable_fields(serializer_class)
+            for role in PLAN_ROLES:
+                get_plan(serializer_class, role)
+    return count
+
+
+def warm_modules():
+    """
+    导入首次请求时才导入的模块：DRF及JWT设置中的类路径、会话及消息存储、SQL编译器（不连接数据库），
+    加载密码哈希、缓存及模板引擎
+    """
+    from django.conf import settings
+    from django.contrib.auth.hashers import get_hashers
+    from django.core.cache import caches
+    from django.db import connections
+    from django.template import engines
+    from django.utils.module_loading import import_string
+    from rest_framework.settings import api_settings, DEFAULTS
+    from rest_framework_jwt.settings import api_settings as jwt_settings, DEFAULTS as JWT_DEFAULTS
+
+    for name in DEFAULTS:
+        getattr(api_settings, name)
+    for name in JWT_DEFAULTS:
+        getattr(jwt_settings, name)
+    importlib.import_module(settings.SESSION_ENGINE)
+    import_string(settings.SESSION_SERIALIZER)
+    import_string(settings.MESSAGE_STORAGE)
+    for alias in connections:
+        connections[alias].ops.compiler('SQLCompiler')
+    get_hashers()
+    for alias in settings.CACHES:
+        caches[alias]
+    engines.all()
+
+
+def warm_translations():
+    """
+    加载默认语言的翻译，错误信息使用ugettext
+    """
+    from django.conf import settings
+    from django.utils import translation
+
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('This field is required.')
+
+
+def warm_up(timer=startup_timer):
+    """
+    主进程fork工作进程前执行，不连接数据库
+    """
+    with timer.phase('urls'):
+        warm_urls()
+    with timer.phase('modules'):
+        warm_modules()
+    with timer.phase('serializers'):
+        warm_serializers()
+    with timer.phase('translations'):
+        warm_translations()
+
+
+def warm_up_worker(timer=startup_timer):
+    """
+    fork后在工作进程中执行：建立数据库连接后归还，使用连接池时预先创建MIN_SIZE个连接
+    连接失败（数据库不可用、配置错误等）时只记录日志，第一个请求时重新连接
+    """
+    from django.db import connections
+
+    with timer.phase('connections'):
+        for connection in connections.all():
+            try:
+                connection.ensure_connection()
+            except Exception as exc:
+                logger.warning('warm-up connection to database %r failed: %s', connection.alias, exc)
+            finally:
+                connection.close()
+
+
+def discard_connections():
+    """
+    丢弃fork前父进程建立的数据库连接，不关闭
+    子进程与父进程共用socket，关闭时会通知数据库断开（MySQL COM_QUIT），父进程的连接随之失效
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        connection.connection = None
+
+
+def prepare_application(timer=startup_timer):
+    """
+    WSGI入口加载后调用：按settings.WARMUP预热，记录启动耗时
+    工作进程的预热由服务器fork工作进程后调用post_fork，例如gunicorn的post_fork（dark_gold/gunicorn_conf.py）
+    """
+    from django.conf import settings
+
+    options = getattr(settings, 'WARMUP', {})
+    if options.get('ENABLED', True):
+        warm_up(timer)
+    if options.get('REPORT', True):
+        logger.info('startup (pid %s): %s', os.getpid(), timer.format())
+
+
+def post_fork(timer=startup_timer):
+    """
+    服务器fork工作进程后在工作进程中调用，不使用os.register_at_fork：
+    其他fork（导入账户的进程池等）的子进程不预热，也不丢弃、关闭其父进程正在使用的连接
+    """
+    from django.conf import settings
+
+    if not getattr(settings, 'WARMUP', {}).get('POST_FORK', True):
+        return
+    discard_connections()
+    warm_up_worker(timer)
+    logger.info('worker startup (pid %s): %s', os.getpid(), timer.format())
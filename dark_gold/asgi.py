@@ -0,0 +1,18 @@
+"""
+ASGI config for dark_gold project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+使用任意ASGI服务器启动，例如：uvicorn dark_gold.asgi:application --workers 4
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dark_gold.settings')
+django.setup(set_prefix=False)
+
+from app.account.asgi import AccountASGIApplication  # noqa: E402
+
+application = AccountASGIApplication()
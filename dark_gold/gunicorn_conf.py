@@ -0,0 +1,16 @@
+"""
+gunicorn配置，例如：gunicorn dark_gold.wsgi --workers 4 -c dark_gold/gunicorn_conf.py
+
+主进程加载应用并预热一次，fork工作进程后在工作进程中建立数据库连接（settings.WARMUP）
+"""
+
+# 主进程加载应用后fork工作进程
+preload_app = True
+
+
+def post_fork(server, worker):
+    # 只在gunicorn的工作进程中执行，应用内其他fork的子进程不执行
+    if server.cfg.preload_app:
+        from app.account.warmup import post_fork as warm_up_post_fork
+
+        warm_up_post_fork()
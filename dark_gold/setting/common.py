@@ -40,15 +40,48 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.account.middleware.RequestMetricsMiddleware',
+    'app.account.middleware.ReplicaRoutingMiddleware',
+    # 按URL前缀执行 REQUEST_PROFILES 中的中间件
+    'app.account.middleware.RequestProfileMiddleware',
 ]
 
+# 按URL前缀（按顺序匹配第一个）使用的中间件及DRF认证类
+# /api/ 只使用JWT认证，不需要会话、CSRF、消息及点击劫持中间件，也不查询会话表
+# 其他路径（admin等）使用完整的中间件及认证类
+REQUEST_PROFILES = [
+    {
+        'PREFIX': '/api/',
+        'MIDDLEWARE': [
+            'django.middleware.security.SecurityMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        ],
+        'AUTHENTICATION_CLASSES': [
+            'app.account.authentication.ExtendJSONWebTokenAuthentication',
+        ],
+    },
+    {
+        'PREFIX': '/',
+        'MIDDLEWARE': [
+            'django.middleware.security.SecurityMiddleware',
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.middleware.common.CommonMiddleware',
+            'django.middleware.csrf.CsrfViewMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'django.contrib.messages.middleware.MessageMiddleware',
+            'django.middleware.clickjacking.XFrameOptionsMiddleware',
+        ],
+        'AUTHENTICATION_CLASSES': [
+            'app.account.authentication.ExtendJSONWebTokenAuthentication',
+            'rest_framework.authentication.SessionAuthentication',
+            'rest_framework.authentication.BasicAuthentication',
+        ],
+    },
+]
+
+# admin要求MIDDLEWARE中直接包含会话、认证及消息中间件，改由 app.account.checks 检查 REQUEST_PROFILES
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'dark_gold.urls'
 
 TEMPLATES = [
@@ -116,13 +149,22 @@ AUTH_USER_MODEL = 'account.RealUser'
 
 # django rest framework
 REST_FRAMEWORK = {
+    # 安装orjson时使用orjson编码及解析JSON，未安装时与默认的JSONRenderer/JSONParser相同
+    'DEFAULT_RENDERER_CLASSES': (
+        'app.account.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'app.account.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # 按URL前缀使用 REQUEST_PROFILES 中的认证类
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'app.account.authentication.ExtendJSONWebTokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'app.account.authentication.RequestProfileAuthentication',
     ),
 }
 
@@ -137,3 +179,150 @@ JWT_AUTH = {
     # 允许刷新令牌
     'JWT_ALLOW_REFRESH': True,
 }
+
+# 认证用户缓存，避免每次请求查询数据库
+PRINCIPAL_CACHE = {
+    # 是否开启，None为只在ALIAS为共享缓存（memcached等）时开启，进程内缓存不能通知其他工作进程失效
+    'ENABLED': None,
+    # 保存账户版本号的缓存，账户修改后所有进程中的缓存同时失效
+    'ALIAS': 'default',
+    # 最大缓存用户数，0为不缓存
+    'MAX_SIZE': 10000,
+    # 缓存有效期（秒）
+    'TIMEOUT': 60,
+}
+
+# 登录密码哈希线程池，限制登录占用的工作进程
+LOGIN_HASH_POOL = {
+    # 是否开启
+    'ENABLED': False,
+    # thread 线程池，process 进程池
+    'EXECUTOR': 'thread',
+    # 同时执行的哈希数
+    'WORKERS': 4,
+    # 最大排队数，超出时返回503
+    'QUEUE_SIZE': 16,
+    # 等待结果超时时间（秒）
+    'TIMEOUT': 10,
+    # 503响应中Retry-After（秒）
+    'RETRY_AFTER': 1,
+}
+
+# 批量导入账户
+USER_IMPORT = {
+    # 每次写入数据库的行数
+    'CHUNK_SIZE': 1000,
+    # 哈希密码进程数（命令行）或线程数（接口，进程内共享），None为CPU核数
+    'WORKERS': None,
+}
+
+# 流式导出
+EXPORT = {
+    # 每次查询的行数
+    'CHUNK_SIZE': 2000,
+}
+
+# 缓存，默认进程内缓存；多进程部署时使用共享缓存（memcached），认证缓存及响应缓存只在共享缓存中开启
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dark-gold',
+    }
+}
+
+# 读取接口响应缓存（部门列表、部门详情、账户详情）
+RESPONSE_CACHE = {
+    # 是否开启，None为只在ALIAS为共享缓存（memcached等）时开启，进程内缓存不能在其他工作进程修改数据后失效
+    'ENABLED': None,
+    # 使用的缓存
+    'ALIAS': 'default',
+    # 缓存有效期（秒），数据修改时立即失效
+    'TIMEOUT': 300,
+    # 相同请求等待正在执行的请求的最长时间（秒），超时后自行查询
+    'WAIT_TIMEOUT': 10,
+}
+
+# 请求指标（/metrics）
+METRICS = {
+    # 是否开启
+    'ENABLED': True,
+    # 多进程部署时各进程写入统计的共享目录，None为只统计当前进程
+    'DIRECTORY': None,
+    # 写入目录的间隔（秒）
+    'FLUSH_INTERVAL': 5,
+}
+
+# 审计日志（账户、部门修改记录），请求中放入队列，后台线程批量写入
+AUDIT_LOG = {
+    # 是否开启
+    'ENABLED': True,
+    # 队列长度
+    'QUEUE_SIZE': 10000,
+    # 每批最多写入条数
+    'BATCH_SIZE': 100,
+    # 批次未满时最长等待时间（秒）
+    'FLUSH_INTERVAL': 1.0,
+    # 队列已满时请求等待时间（秒），仍然已满时在请求中直接写入
+    'BLOCK_TIMEOUT': 0.5,
+    # 进程退出时等待写入剩余日志的时间（秒）
+    'SHUTDOWN_TIMEOUT': 5,
+}
+
+# ASGI入口（dark_gold/asgi.py），Django视图在线程池中执行
+ASGI_EXECUTOR = {
+    # 同时执行的请求数，不超过数据库连接数
+    'WORKERS': 8,
+    # 最大排队数，超出时返回503
+    'QUEUE_SIZE': 64,
+    # 503响应中Retry-After（秒）
+    'RETRY_AFTER': 1,
+}
+
+# 数据库连接池，ENGINE为app.account.backends.mysql或app.account.backends.sqlite3时生效
+# 每个进程一个连接池，可在DATABASES中的POOL覆盖
+DATABASE_POOL = {
+    'ENABLED': True,
+    # 最少保持的连接数，进程第一次访问数据库时创建
+    'MIN_SIZE': 2,
+    # 最大连接数，不小于ASGI_EXECUTOR的WORKERS
+    'MAX_SIZE': 10,
+    # 连接最长使用时间（秒），超出后关闭重建，应小于MySQL的wait_timeout
+    'MAX_LIFETIME': 1800,
+    # 超出MIN_SIZE的连接空闲多久（秒）后关闭
+    'MAX_IDLE': 600,
+    # 连接已满时等待归还的最长时间（秒），超时抛出OperationalError
+    'TIMEOUT': 10,
+    # 连接空闲超过此时间（秒）时，取出前检查连接是否可用，0为每次检查
+    'HEALTH_CHECK_INTERVAL': 0,
+}
+
+# 批量请求（/api/batch/）
+BATCH_REQUESTS = {
+    # 最多子请求数
+    'MAX_ITEMS': 50,
+    # 请求体最大字节数，超出返回413
+    'MAX_BODY_SIZE': 1024 * 1024,
+}
+
+# 启动预热（dark_gold/wsgi.py），预加载应用时在主进程fork工作进程前执行
+WARMUP = {
+    # 加载路由、序列化器字段、快速序列化计划及延迟导入的模块
+    'ENABLED': True,
+    # fork后在工作进程中建立数据库连接，使用连接池时预先创建MIN_SIZE个连接
+    # 由服务器的fork钩子调用app.account.warmup.post_fork（dark_gold/gunicorn_conf.py）
+    'POST_FORK': True,
+    # 记录各阶段耗时（INFO日志）
+    'REPORT': True,
+}
+
+# 读写分离，写入使用default，读取使用只读副本
+DATABASE_ROUTERS = ['app.account.routers.ReplicaRouter']
+
+DATABASE_REPLICAS = {
+    # 只读副本的数据库别名，为空时全部使用default
+    'ALIASES': [],
+    # 写入后，写入者及被修改账户的请求从主库读取的时间（秒），应大于主从复制延迟
+    'STICKY_SECONDS': 5,
+    # 记录写入的缓存，配置副本时必须为共享缓存（多个工作进程同时可见）
+    'CACHE_ALIAS': 'default',
+}
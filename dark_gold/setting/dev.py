@@ -10,3 +10,7 @@ DATABASES['default'] = {
     'ENGINE': 'django.db.backends.sqlite3',
     'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
 }
+
+# 开发环境单进程运行，进程内缓存即可保证失效
+PRINCIPAL_CACHE['ENABLED'] = True
+RESPONSE_CACHE['ENABLED'] = True
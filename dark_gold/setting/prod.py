@@ -8,12 +8,33 @@ ALLOWED_HOSTS += [
 SECRET_KEY = os.environ.get('DJANGO_SETTINGS_DARK_GOLD_SECRET_KEY',
                             '6$2pdw)gsz)g)*_g6*#dp4^f4h(kl6sl^k44p!z=r=or-#yh@$')
 
-# prod database
+# prod database，使用连接池，每个请求结束时归还连接（CONN_MAX_AGE为0）
 DATABASES['default'] = {
-    'ENGINE': 'django.db.backends.mysql',
+    'ENGINE': 'app.account.backends.mysql',
     'NAME': os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_NAME', 'account_serve'),
     'USER': os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_USER', ''),
     'PASSWORD': os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_PASSWORD', ''),
     'HOST': os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_HOST', ''),
     'PORT': os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_PORT', ''),
+    'CONN_MAX_AGE': 0,
+    'POOL': {
+        'MIN_SIZE': int(os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_POOL_MIN_SIZE', DATABASE_POOL['MIN_SIZE'])),
+        'MAX_SIZE': int(os.environ.get('DJANGO_SETTINGS_DARK_GOLD_DATABASE_POOL_MAX_SIZE', DATABASE_POOL['MAX_SIZE'])),
+    },
 }
+
+# prod replicas，只读副本与主库使用相同的账号及数据库名称，多个主机以逗号分隔
+for _index, _host in enumerate(filter(None, os.environ.get(
+        'DJANGO_SETTINGS_DARK_GOLD_DATABASE_REPLICA_HOSTS', '').split(','))):
+    DATABASES['replica%s' % _index] = dict(DATABASES['default'], HOST=_host, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS['ALIASES'].append('replica%s' % _index)
+
+# prod cache，多进程共享，保证响应缓存在所有进程中同时失效
+if os.environ.get('DJANGO_SETTINGS_DARK_GOLD_CACHE_LOCATION'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ['DJANGO_SETTINGS_DARK_GOLD_CACHE_LOCATION'].split(','),
+    }
+
+# prod metrics，多个工作进程的统计写入同一目录，读取时合并
+METRICS['DIRECTORY'] = os.environ.get('DJANGO_SETTINGS_DARK_GOLD_METRICS_DIRECTORY')
@@ -1,3 +1,5 @@
+import tempfile
+
 from .dev import *
 
 ALLOWED_HOSTS = ['*']
@@ -10,3 +12,14 @@ DATABASES['default'] = {
         # 'NAME': 'test-db.sqlite3'
     }
 }
+
+# 只读副本，测试读写分离时使用，默认不启用（DATABASE_REPLICAS['ALIASES']为空）
+# 测试数据库按NAME区分，NAME相同时副本会使用default的测试数据库
+# NAME只用于区分，放在临时目录中，连接时创建的空文件不留在项目目录
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(tempfile.gettempdir(), 'dark_gold-replica-db.sqlite3'),
+    'TEST': {
+        'NAME': os.path.join(BASE_DIR, 'test-replica-db.sqlite3'),
+    }
+}
@@ -16,13 +16,19 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from app.account.views import BatchView, RequestMetricsView
+
 api_url = [
     # 账号系统
     path('account/', include('app.account.urls')),
+    # 批量请求
+    path('batch/', BatchView.as_view(), name='batch'),
 
 ]
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(api_url)),
+    # 请求指标（管理员）
+    path('metrics', RequestMetricsView.as_view(), name='metrics'),
 ]
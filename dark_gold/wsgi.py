@@ -5,12 +5,28 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
+
+加载时按settings.WARMUP预热（路由、序列化器、延迟导入的模块），fork后工作进程建立数据库连接
+预加载应用的服务器在主进程fork前只预热一次，工作进程由服务器的fork钩子调用app.account.warmup.post_fork，
+例如：gunicorn dark_gold.wsgi --workers 4 -c dark_gold/gunicorn_conf.py
+各阶段耗时见 python manage.py startup_report
 """
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+import django
+from django.conf import settings
+
+from app.account.warmup import startup_timer, prepare_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dark_gold.settings')
 
-application = get_wsgi_application()
+with startup_timer.phase('settings'):
+    settings.INSTALLED_APPS
+with startup_timer.phase('setup'):
+    django.setup(set_prefix=False)
+with startup_timer.phase('handler'):
+    from django.core.handlers.wsgi import WSGIHandler
+    application = WSGIHandler()
+
+prepare_application()